@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Offset/length views on message bytes: the Java byte array is copied once, everything else is a view on it
+
+
+class ByteView(object):
+    __slots__ = ('data', 'start', 'end')
+
+    def __init__(self, data, start=0, end=None):
+        self.data = data
+        self.start = start
+        self.end = len(data) if end is None else end
+
+    # The one copy of a Burp byte[] (Jython array) made per decode.
+    @classmethod
+    def wrap(cls, content):
+        return cls(content.tostring())
+
+    def __len__(self):
+        return self.end - self.start
+
+    # View of self[start:end], offsets relative to this view.
+    def slice(self, start, end=None):
+        end = len(self) if end is None else min(end, len(self))
+        return ByteView(self.data, self.start + start, self.start + end)
+
+    def memoryview(self):
+        # for the protobuf decoders, which expect a memoryview
+        return memoryview(self.data)[self.start:self.end]
+
+    def buffer(self):
+        # for C functions taking old-style buffers (hashlib, zlib, struct)
+        return buffer(self.data, self.start, len(self))
+
+    def tobytes(self):
+        if self.start == 0 and self.end == len(self.data):
+            return self.data
+        return self.data[self.start:self.end]
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+# Content-Encoding and grpc-encoding codecs, with capped decompression. Edited bodies are compressed again
+# with the parameters found while decoding
+import struct
+import zlib
+
+from byte_view import ByteView
+
+# Size of the compressed chunks fed to the decompressor
+CHUNK_SIZE = 64 * 1024
+
+
+class DecompressionError(Exception):
+    pass
+
+
+# Inflate view from pos. Returns (data, position after the compressed stream).
+def _inflate(view, pos, wbits, max_size):
+    inflater = zlib.decompressobj(wbits)
+    out = []
+    size = 0
+    data = view.data
+    end = view.end
+    pos += view.start
+
+    try:
+        while pos < end and not inflater.unused_data:
+            chunk = data[pos:min(pos + CHUNK_SIZE, end)]
+            pos += len(chunk)
+
+            while chunk:
+                block = inflater.decompress(chunk, max_size - size + 1)
+                size += len(block)
+                if size > max_size:
+                    raise DecompressionError('Decompressed body larger than %d bytes' % (max_size, ))
+                out.append(block)
+                chunk = inflater.unconsumed_tail
+
+        block = inflater.flush()
+    except zlib.error as error:
+        raise DecompressionError(str(error))
+
+    size += len(block)
+    if size > max_size:
+        raise DecompressionError('Decompressed body larger than %d bytes' % (max_size, ))
+    out.append(block)
+
+    return ''.join(out), pos - len(inflater.unused_data) - view.start
+
+
+def _deflate(data, level, wbits):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+    return compressor.compress(data) + compressor.flush()
+
+
+class IdentityCodec(object):
+    def decompress(self, view, max_size):
+        return view, None
+
+    def compress(self, data, params):
+        return data
+
+
+class GzipCodec(object):
+    MAGIC = '\x1f\x8b'
+
+    FHCRC = 0x02
+    FEXTRA = 0x04
+    FNAME = 0x08
+    FCOMMENT = 0x10
+
+    def _header_end(self, data, pos):
+        if data[pos:pos + 2] != self.MAGIC or data[pos + 2:pos + 3] != '\x08':
+            raise DecompressionError('Not a gzip body')
+
+        flags = ord(data[pos + 3])
+        end = pos + 10
+
+        if flags & self.FEXTRA:
+            end += 2 + struct.unpack('<H', data[end:end + 2])[0]
+        if flags & self.FNAME:
+            end = data.index('\x00', end) + 1
+        if flags & self.FCOMMENT:
+            end = data.index('\x00', end) + 1
+        if flags & self.FHCRC:
+            end += 2
+
+        return end
+
+    def decompress(self, view, max_size):
+        data = view.data
+        pos = view.start
+        members = []
+        header = None
+
+        # a gzip body can be made of several members
+        while pos < view.end:
+            try:
+                start = self._header_end(data, pos)
+            except (IndexError, ValueError, struct.error):
+                raise DecompressionError('Truncated gzip header')
+            if start > view.end:
+                raise DecompressionError('Truncated gzip header')
+
+            if header is None:
+                header = data[pos:start]
+
+            member, end = _inflate(view, start - view.start, -zlib.MAX_WBITS, max_size)
+            end += view.start
+            if end + 8 > view.end:
+                raise DecompressionError('Truncated gzip body')
+
+            crc, length = struct.unpack('<II', data[end:end + 8])
+            if crc != zlib.crc32(member) & 0xffffffff or length != len(member) & 0xffffffff:
+                raise DecompressionError('Corrupted gzip body')
+
+            members.append(member)
+            max_size -= len(member)
+            pos = end + 8
+
+            # zero padding after the last member
+            if not data[pos:view.end].strip('\x00'):
+                break
+
+        return ByteView(''.join(members)), header
+
+    def compress(self, data, header):
+        level = 6
+        if header is None:
+            header = self.MAGIC + '\x08\x00\x00\x00\x00\x00\x00\xff'
+        else:
+            # XFL hints the level: 2 is maximum compression, 4 the fastest
+            level = {2: 9, 4: 1}.get(ord(header[8]), 6)
+            # the header CRC would no longer match: drop it, keep the other fields
+            if ord(header[3]) & self.FHCRC:
+                header = header[:3] + chr(ord(header[3]) & ~self.FHCRC) + header[4:-2]
+
+        return header + _deflate(data, level, -zlib.MAX_WBITS) + struct.pack(
+            '<II', zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+
+
+class DeflateCodec(object):
+    # FLEVEL of the zlib header, 0 (fastest) to 3 (maximum compression)
+    LEVELS = (1, 5, 6, 9)
+
+    def decompress(self, view, max_size):
+        head = view.slice(0, 2).tobytes()
+
+        # "deflate" should be zlib wrapped (RFC 1950) but raw deflate is common too
+        if len(head) == 2 and ord(head[0]) & 0x0f == 8 and struct.unpack('>H', head)[0] % 31 == 0:
+            data, _ = _inflate(view, 0, zlib.MAX_WBITS, max_size)
+            return ByteView(data), ('zlib', self.LEVELS[ord(head[1]) >> 6])
+
+        data, _ = _inflate(view, 0, -zlib.MAX_WBITS, max_size)
+        return ByteView(data), ('raw', 6)
+
+    def compress(self, data, params):
+        wrapper, level = params or ('zlib', 6)
+        wbits = zlib.MAX_WBITS if wrapper == 'zlib' else -zlib.MAX_WBITS
+        return _deflate(data, level, wbits)
+
+
+CODECS = {
+    'identity': IdentityCodec(),
+    'gzip': GzipCodec(),
+    'x-gzip': GzipCodec(),
+    'deflate': DeflateCodec(),
+}
+
+
+def get_codec(name):
+    codec = CODECS.get(name.strip().lower())
+    if codec is None:
+        raise DecompressionError('Unsupported encoding: %s' % (name, ))
+    return codec
+
+
+# Codecs of a header like Content-Encoding, in the order they were applied. decode() returns a new Encoding holding the
+# parameters of each codec, which encode() reuses.
+class Encoding(object):
+    def __init__(self, codecs, params=None):
+        self.codecs = codecs
+        self.params = params or [None] * len(codecs)
+
+    @classmethod
+    def parse(cls, value):
+        names = value.split(',') if value else []
+        return cls([get_codec(name) for name in names if name.strip()])
+
+    @property
+    def identity(self):
+        return all(isinstance(codec, IdentityCodec) for codec in self.codecs)
+
+    def decode(self, view, max_size):
+        params = []
+        for codec in reversed(self.codecs):
+            view, param = codec.decompress(view, max_size)
+            params.append(param)
+        params.reverse()
+        return view, Encoding(self.codecs, params)
+
+    def encode(self, data):
+        for codec, params in zip(self.codecs, self.params):
+            data = codec.compress(data, params)
+        return data
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# LRU cache of decoded messages, bounded by their approximate size in bytes
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def body_digest(content):
+    return hashlib.sha1(content).digest()
+
+
+class DecodeCache(object):
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            # re-insert as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, weight):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[0]
+
+            # a single entry bigger than the whole cache is not worth keeping
+            if weight > self.max_bytes:
+                return
+
+            self._entries[key] = (weight, value)
+            self.size += weight
+
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return "%d entries, %d/%d bytes, %d hits, %d misses, %d evictions" % (
+            len(self._entries), self.size, self.max_bytes, self.hits,
+            self.misses, self.evictions)
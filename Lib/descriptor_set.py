@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Protos loaded from FileDescriptorSets: message classes are built from a DescriptorPool of each set,
+# without generating or importing Python modules
+import importlib
+from collections import OrderedDict
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+
+from message_types import proto_types
+from proto_graph import BUILTIN_PREFIX, module_name
+
+
+# FileDescriptorProto of a well-known type, from the protobuf runtime.
+def builtin_file(name):
+    module = importlib.import_module(module_name(name))
+    file_proto = descriptor_pb2.FileDescriptorProto()
+    module.DESCRIPTOR.CopyToProto(file_proto)
+    return file_proto
+
+
+# Message types of the serialized FileDescriptorSet data, keyed by proto name in the order of the set.
+def read_descriptor_set(data):
+    files = descriptor_pb2.FileDescriptorSet.FromString(data).file
+    pool = descriptor_pool.DescriptorPool()
+
+    names = set(file_proto.name for file_proto in files)
+    for file_proto in files:
+        pool.Add(file_proto)
+
+    # sets built without --include_imports lack the well-known types
+    pending = [dependency for file_proto in files for dependency in file_proto.dependency]
+    while pending:
+        dependency = pending.pop()
+        if dependency in names or not dependency.startswith(BUILTIN_PREFIX):
+            continue
+
+        file_proto = builtin_file(dependency)
+        pool.Add(file_proto)
+        names.add(dependency)
+        pending.extend(file_proto.dependency)
+
+    return OrderedDict((file_proto.name, proto_types(file_proto, pool)) for file_proto in files)
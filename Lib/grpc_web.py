@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# gRPC-web body framing: 1-byte flag, 4-byte big-endian length and payload for each frame
+import struct
+
+FLAG_COMPRESSED = 0x01
+FLAG_TRAILER = 0x80
+
+HEADER_SIZE = 5
+
+# Marks the start of every frame in the editor text when a body has more than one frame
+MARKER = '# gRPC-web '
+
+_HEADER = struct.Struct('>BI')
+
+
+class Frame(object):
+    __slots__ = ('flag', 'start', 'end')
+
+    def __init__(self, flag, start, end):
+        self.flag = flag
+        # payload offsets in the body
+        self.start = start
+        self.end = end
+
+    @property
+    def compressed(self):
+        return bool(self.flag & FLAG_COMPRESSED)
+
+    @property
+    def trailer(self):
+        return bool(self.flag & FLAG_TRAILER)
+
+
+# Split a ByteView in frames. Returns None unless the view is exactly a sequence of well-formed frames. Frames only
+# hold offsets, payloads are sliced when needed.
+def parse_frames(view):
+    size = len(view)
+    if size < HEADER_SIZE:
+        return None
+
+    frames = []
+    pos = 0
+    while pos < size:
+        if pos + HEADER_SIZE > size:
+            return None
+
+        flag, length = _HEADER.unpack_from(view.data, view.start + pos)
+        if flag & ~(FLAG_COMPRESSED | FLAG_TRAILER):
+            return None
+
+        start = pos + HEADER_SIZE
+        pos = start + length
+        if pos > size:
+            return None
+
+        frames.append(Frame(flag, start, pos))
+
+    return frames
+
+
+def build_frame(flag, payload):
+    return _HEADER.pack(flag, len(payload)) + payload
+
+
+# Frames of a body, kept to render every message and rebuild the body.
+class Framing(object):
+    def __init__(self, view, frames):
+        self.view = view
+        self.frames = frames
+
+        # decoded grpc-encoding of each compressed frame, reused to compress it again
+        self.encodings = {}
+
+    def payload(self, frame):
+        # a view on the body, not a copy
+        return self.view.slice(frame.start, frame.end)
+
+    @property
+    def messages(self):
+        return [frame for frame in self.frames if not frame.trailer]
+
+    # Payloads of the data frames, compressed ones decoded with encoding (grpc-encoding).
+    def payloads(self, encoding, max_size):
+        payloads = []
+        for index, frame in enumerate(self.frames):
+            if frame.trailer:
+                continue
+
+            payload = self.payload(frame)
+            if frame.compressed:
+                payload, self.encodings[index] = encoding.decode(payload, max_size)
+            payloads.append(payload)
+        return payloads
+
+    # Join the text of each data frame; trailers are shown as comments.
+    def render(self, texts):
+        if len(self.frames) == 1 and texts:
+            return texts[0]
+
+        lines = []
+        texts = iter(texts)
+        for number, frame in enumerate(self.frames, 1):
+            if frame.trailer:
+                lines.append('%strailers\n' % (MARKER, ))
+                for line in self.payload(frame).tobytes().splitlines():
+                    lines.append('# %s\n' % (line, ))
+            else:
+                lines.append('%sframe %d\n' % (MARKER, number))
+                lines.append(next(texts))
+
+            if not lines[-1].endswith('\n'):
+                lines[-1] += '\n'
+
+        return ''.join(lines)
+
+    # Inverse of render: the (edited) text of each data frame.
+    def split(self, text):
+        if len(self.frames) == 1:
+            return [text] if self.messages else []
+
+        sections = []
+        for line in text.splitlines(True):
+            if line.startswith(MARKER):
+                sections.append([])
+            elif sections:
+                sections[-1].append(line)
+            elif line.strip():
+                raise ValueError('Text found before the first gRPC-web frame marker')
+
+        if len(sections) != len(self.frames):
+            raise ValueError('gRPC-web frame markers were modified: %d frames expected, %d found' % (
+                len(self.frames), len(sections)))
+
+        return [''.join(section) for frame, section in zip(self.frames, sections)
+                if not frame.trailer]
+
+    # Rebuild the body with new data frame payloads, trailers are kept as they are.
+    def build(self, payloads):
+        payloads = iter(payloads)
+        out = []
+        for index, frame in enumerate(self.frames):
+            if frame.trailer:
+                payload = self.payload(frame).tobytes()
+            else:
+                payload = next(payloads)
+                if frame.compressed:
+                    payload = self.encodings[index].encode(payload)
+            out.append(build_frame(frame.flag, payload))
+        return ''.join(out)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Header lookups in the raw bytes of HTTP messages, without analyzing the whole message
+import array
+
+# Media types handled by the extension, compared without parameters
+PROTOBUF_MEDIA_TYPES = frozenset([
+    'application/protobuf',
+    'application/x-protobuf',
+    'application/x-protobuffer',
+    'application/octet-stream',
+    'application/grpc-web+proto',
+])
+
+CRLF = array.array('b', '\r\n')
+HEADERS_END = array.array('b', '\r\n\r\n')
+
+
+def header_pattern(name):
+    # The leading CRLF anchors the match to the start of a header line
+    return array.array('b', '\r\n%s:' % (name.lower(), ))
+
+
+CONTENT_TYPE = header_pattern('Content-Type')
+
+
+def media_type(value):
+    return value.split(';', 1)[0].strip().lower()
+
+
+# Return the value of the first header matching pattern, or None.
+def header_value(helpers, content, pattern):
+    end = helpers.indexOf(content, HEADERS_END, False, 0, len(content))
+    if end == -1:
+        end = len(content)
+
+    start = helpers.indexOf(content, pattern, False, 0, end)
+    if start == -1:
+        return None
+    start += len(pattern)
+
+    stop = helpers.indexOf(content, CRLF, False, start, end)
+    if stop == -1:
+        stop = end
+
+    return content[start:stop].tostring()
+
+
+# Value of the first header called name in the list of an analyzed message.
+def analyzed_header(headers, name):
+    name = name.lower()
+
+    # first header is the request/response line
+    for header in headers[1:]:
+        key, _, value = header.partition(':')
+        if key.strip().lower() == name:
+            return value.strip()
+    return None
+
+
+def is_protobuf(helpers, content):
+    value = header_value(helpers, content, CONTENT_TYPE)
+    return value is not None and media_type(value) in PROTOBUF_MEDIA_TYPES
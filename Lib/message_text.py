@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+# Text format of big decoded messages with their biggest parts collapsed into numbered comments, and
+# restoring what was collapsed after the text is edited
+import re
+from cStringIO import StringIO
+
+from google.protobuf import text_format
+from google.protobuf.descriptor import FieldDescriptor
+
+COLLAPSED_MARKER = re.compile(r'collapsed \[(\d+)\]')
+
+
+# A collapsed part: entries from start on of a repeated field, keys of a map, or a whole value.
+class Region(object):
+    __slots__ = ('path', 'field', 'start', 'keys')
+
+    def __init__(self, path, field, start=None, keys=None):
+        # (field, index or None) of the messages leading to the one holding the field in the rendered message
+        self.path = path
+        self.field = field
+        self.start = start
+        self.keys = keys
+
+
+class Rendering(object):
+    __slots__ = ('text', 'regions', 'message')
+
+    def __init__(self, text, regions, message):
+        self.text = text
+        self.regions = regions
+        # the rendered message, where collapsed parts are taken back from
+        self.message = message
+
+
+def field_name(field):
+    if field.is_extension:
+        return '[%s]' % (field.full_name, )
+    elif field.type == FieldDescriptor.TYPE_GROUP:
+        return field.message_type.name
+    return field.name
+
+
+def is_map(field):
+    return (field.type == FieldDescriptor.TYPE_MESSAGE and field.message_type.has_options and
+            field.message_type.GetOptions().map_entry)
+
+
+class _Renderer(object):
+    def __init__(self, max_entries, max_value):
+        self.max_entries = max_entries
+        self.max_value = max_value
+        self.out = StringIO()
+        self.regions = []
+
+    def collapse(self, indent, text, region):
+        self.regions.append(region)
+        self.out.write('%s# %s, collapsed [%d]\n' % (' ' * indent, text, len(self.regions) - 1))
+
+    def message(self, message, indent, path):
+        for field, value in message.ListFields():
+            if field.is_extension:
+                # not collapsed, they are not attributes of the message
+                for element in (value if field.label == FieldDescriptor.LABEL_REPEATED else [value]):
+                    text_format.PrintField(field, element, self.out, indent)
+            elif is_map(field):
+                self.map(field, value, indent, path)
+            elif field.label == FieldDescriptor.LABEL_REPEATED:
+                self.repeated(field, value, indent, path)
+            elif field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+                self.nested(field, value, indent, path + ((field, None), ))
+            elif field.cpp_type == FieldDescriptor.CPPTYPE_STRING and len(value) > self.max_value:
+                self.collapse(indent, '%s: %d %s' % (
+                    field_name(field), len(value), 'bytes' if field.type == FieldDescriptor.TYPE_BYTES else 'characters'),
+                    Region(path, field))
+            else:
+                text_format.PrintField(field, value, self.out, indent)
+
+    def nested(self, field, value, indent, path):
+        self.out.write('%s%s {\n' % (' ' * indent, field_name(field)))
+        self.message(value, indent + 2, path)
+        self.out.write('%s}\n' % (' ' * indent, ))
+
+    def repeated(self, field, values, indent, path):
+        for index, value in enumerate(values[:self.max_entries]):
+            if field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+                self.nested(field, value, indent, path + ((field, index), ))
+            else:
+                text_format.PrintField(field, value, self.out, indent)
+
+        if len(values) > self.max_entries:
+            self.collapse(indent, '%s: %d more entries' % (field_name(field), len(values) - self.max_entries),
+                          Region(path, field, start=self.max_entries))
+
+    def map(self, field, value, indent, path):
+        keys = sorted(value)
+        entry_class = value.GetEntryClass()
+        for key in keys[:self.max_entries]:
+            text_format.PrintField(field, entry_class(key=key, value=value[key]), self.out, indent)
+
+        if len(keys) > self.max_entries:
+            self.collapse(indent, '%s: %d more entries' % (field_name(field), len(keys) - self.max_entries),
+                          Region(path, field, keys=keys[self.max_entries:]))
+
+
+# Rendering of message showing at most max_entries entries of each repeated field and string/bytes values of at most
+# max_value characters.
+def render(message, max_entries, max_value):
+    renderer = _Renderer(max_entries, max_value)
+    renderer.message(message, 0, ())
+    return Rendering(renderer.out.getvalue(), renderer.regions, message)
+
+
+# (name, index among the entries of that name) of the entries enclosing each collapsed comment of text.
+def marker_paths(text):
+    tokenizer = text_format.Tokenizer(text.split('\n'), skip_comments=False)
+    paths = {}
+    path = []
+    # entries seen of each name, and name of the list being read (None outside lists), of every open entry
+    frames = [({}, None)]
+    previous = []
+
+    while not tokenizer.AtEnd():
+        token = tokenizer.token
+        tokenizer.NextToken()
+        counts, list_name = frames[-1]
+
+        if token.startswith('#'):
+            marker = COLLAPSED_MARKER.search(token)
+            if marker is not None:
+                paths.setdefault(int(marker.group(1)), tuple(path))
+            continue
+
+        if token in ('{', '<'):
+            if list_name is not None:
+                name = list_name
+            else:
+                name = previous[-2] if previous[-1:] == [':'] else previous[-1]
+            index = counts.get(name, 0)
+            counts[name] = index + 1
+            path.append((name, index))
+            frames.append(({}, None))
+            previous = []
+            continue
+
+        if token in ('}', '>'):
+            frames.pop()
+            path.pop()
+            previous = []
+            continue
+
+        if token == '[':
+            if previous[-1:] == [':']:
+                # list of values or messages
+                frames[-1] = (counts, previous[-2])
+            else:
+                # extension or Any type name
+                name = [token]
+                while not tokenizer.AtEnd() and name[-1] != ']':
+                    name.append(tokenizer.token)
+                    tokenizer.NextToken()
+                previous.append(''.join(name))
+            continue
+
+        if token == ']' and list_name is not None:
+            frames[-1] = (counts, None)
+            continue
+
+        previous.append(token)
+
+    return paths
+
+
+def _field(message, name):
+    descriptor = message.DESCRIPTOR
+    field = descriptor.fields_by_name.get(name)
+    if field is None:
+        # groups are written with the name of their type
+        for field in descriptor.fields:
+            if field.type == FieldDescriptor.TYPE_GROUP and field.message_type.name == name:
+                return field
+    return field
+
+
+# Message at path (from marker_paths) in message, None if it is not there.
+def _locate(message, path):
+    for name, index in path:
+        field = _field(message, name)
+        if field is None or field.cpp_type != FieldDescriptor.CPPTYPE_MESSAGE or is_map(field):
+            return None
+        if field.label == FieldDescriptor.LABEL_REPEATED:
+            values = getattr(message, field.name)
+            if index >= len(values):
+                return None
+            message = values[index]
+        else:
+            message = getattr(message, field.name)
+    return message
+
+
+def _follow(message, path):
+    for field, index in path:
+        if index is None:
+            if not message.HasField(field.name):
+                return None
+            message = getattr(message, field.name)
+        else:
+            values = getattr(message, field.name)
+            if index >= len(values):
+                return None
+            message = values[index]
+    return message
+
+
+# Puts back in edited (parsed from text) what rendering collapsed.
+def restore(edited, rendering, text):
+    paths = marker_paths(text)
+
+    for number, region in enumerate(rendering.regions):
+        if number not in paths:
+            continue
+
+        target = _locate(edited, paths[number])
+        source = _follow(rendering.message, region.path)
+        if target is None or source is None or target.DESCRIPTOR is not region.field.containing_type:
+            continue
+
+        name = region.field.name
+        if region.keys is not None:
+            target_map = getattr(target, name)
+            source_map = getattr(source, name)
+            for key in region.keys:
+                if key in target_map:
+                    continue
+                if region.field.message_type.fields_by_name['value'].cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+                    target_map[key].CopyFrom(source_map[key])
+                else:
+                    target_map[key] = source_map[key]
+
+        elif region.start is not None:
+            getattr(target, name).extend(getattr(source, name)[region.start:])
+
+        else:
+            setattr(target, name, getattr(source, name))
+
+    return edited
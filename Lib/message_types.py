@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Names, fields and nested types of the loaded message types, read from the FileDescriptorProto. Descriptors
+# and classes are only built the first time a type is used
+import threading
+from collections import OrderedDict
+
+from google.protobuf.descriptor import FieldDescriptor
+
+MESSAGE_FIELD_TYPES = (FieldDescriptor.TYPE_MESSAGE, FieldDescriptor.TYPE_GROUP)
+
+# The pure-Python DescriptorPool is not thread safe, decode workers resolve types too
+_resolve_lock = threading.Lock()
+
+
+# Package of the top-level message types of a file, '' if it has none.
+def types_package(types):
+    for message_type in types.itervalues():
+        return message_type.full_name[:-len(message_type.name)].rstrip('.')
+    return ''
+
+
+class Field(object):
+    __slots__ = ('number', 'type', 'label', 'message_type')
+
+    def __init__(self, number, type, label, message_type):
+        self.number = number
+        self.type = type
+        self.label = label
+        # full name of the message type of message fields, None otherwise
+        self.message_type = message_type
+
+    @classmethod
+    def from_proto(cls, field_proto):
+        message_type = None
+        if field_proto.type in MESSAGE_FIELD_TYPES:
+            message_type = field_proto.type_name.lstrip('.')
+        return cls(field_proto.number, field_proto.type, field_proto.label, message_type)
+
+    @classmethod
+    def from_descriptor(cls, field):
+        message_type = field.message_type.full_name if field.message_type is not None else None
+        return cls(field.number, field.type, field.label, message_type)
+
+
+class MessageType(object):
+    __slots__ = ('name', 'full_name', 'fields', 'fields_by_number', 'nested_types_by_name', 'map_entry',
+                 '_pool', '_descriptor')
+
+    def __init__(self, name, full_name, fields, nested_types, map_entry, pool=None, descriptor=None):
+        self.name = name
+        self.full_name = full_name
+        self.fields = fields
+        self.fields_by_number = dict((field.number, field) for field in fields)
+        self.nested_types_by_name = OrderedDict((nested.name, nested) for nested in nested_types)
+        self.map_entry = map_entry
+
+        # the type is resolved from the pool unless its descriptor was already built
+        self._pool = pool
+        self._descriptor = descriptor
+
+    @property
+    def nested_types(self):
+        return self.nested_types_by_name.values()
+
+    @property
+    def descriptor(self):
+        with _resolve_lock:
+            if self._descriptor is None:
+                self._descriptor = self._pool.FindMessageTypeByName(self.full_name)
+                self._pool = None
+            return self._descriptor
+
+    # scope: full name of the package or of the enclosing message.
+    @classmethod
+    def from_proto(cls, message_proto, scope, pool):
+        full_name = '%s.%s' % (scope, message_proto.name) if scope else message_proto.name
+        return cls(message_proto.name, full_name,
+                   tuple(Field.from_proto(field) for field in message_proto.field),
+                   [cls.from_proto(nested, full_name, pool) for nested in message_proto.nested_type],
+                   message_proto.options.map_entry, pool=pool)
+
+    @classmethod
+    def from_descriptor(cls, descriptor):
+        return cls(descriptor.name, descriptor.full_name,
+                   tuple(Field.from_descriptor(field) for field in descriptor.fields),
+                   [cls.from_descriptor(nested) for nested in descriptor.nested_types],
+                   descriptor.GetOptions().map_entry if descriptor.has_options else False,
+                   descriptor=descriptor)
+
+
+# Top-level message types of a FileDescriptorProto, by name. Resolved from pool when used.
+def proto_types(file_proto, pool):
+    return OrderedDict((message.name, MessageType.from_proto(message, file_proto.package, pool))
+                       for message in file_proto.message_type)
+
+
+# Top-level message types of an already built FileDescriptor, by name.
+def descriptor_types(file_descriptor):
+    return OrderedDict((name, MessageType.from_descriptor(descriptor))
+                       for name, descriptor in file_descriptor.message_types_by_name.iteritems())
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Parameter processing rules compiled from the rows of the table. The table replaces them as a whole when
+# edited, so readers on any thread use them without locking
+from collections import OrderedDict
+
+
+# The functions applied to the value of a parameter, in order.
+class Pipeline(object):
+    __slots__ = ('before', 'after')
+
+    def __init__(self, before, after):
+        self.before = tuple(before)
+        self.after = tuple(after)
+
+    def decode(self, value):
+        for function in self.before:
+            value = function(value)
+        return value
+
+    def encode(self, value):
+        for function in self.after:
+            value = function(value)
+        return value
+
+
+class ParameterRules(object):
+    # rows: (parameter type, name, 'before' or 'after', function or None for no processing) of enabled rules.
+    def __init__(self, rows):
+        steps = OrderedDict()
+        for ptype, name, when, function in rows:
+            before, after = steps.setdefault((ptype, name), ([], []))
+            if function is not None:
+                (before if when == 'before' else after).append(function)
+
+        # (type, name) -> Pipeline, in table order: the first parameter of the request with a rule is processed
+        self.pipelines = OrderedDict((key, Pipeline(before, after)) for key, (before, after) in steps.iteritems())
+        # a request without any of these parameter names does not need its parameters compared
+        self.names = frozenset(name for _, name in self.pipelines)
+
+    def __len__(self):
+        return len(self.pipelines)
+
+    # Pipeline of a Burp IParameter, None if it has no rule.
+    def pipeline(self, parameter):
+        return self.pipelines.get((parameter.getType(), parameter.getName()))
+
+    # The parameter, among parameters, of the first rule of the table, None if no rule matches.
+    def find(self, parameters):
+        found = {}
+        for parameter in parameters:
+            if parameter.getName() in self.names:
+                found.setdefault((parameter.getType(), parameter.getName()), parameter)
+
+        for key in self.pipelines:
+            if key in found:
+                return found[key]
+        return None
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# On-disk cache of what protoc compiled, keyed by a digest of the proto graph and of the protoc version
+import os
+import shutil
+import tempfile
+import threading
+
+
+class ProtoCache(object):
+    # version: returns the protoc version, called when a key is first needed.
+    def __init__(self, directory, version):
+        self.directory = directory
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+
+    # kind: what is stored, 'modules' or 'descriptors'.
+    def key(self, graph, kind):
+        return graph.digest('%s\0%s' % (self.version(), kind))
+
+    # Directory holding the compiled protos, None if they were never stored.
+    def get(self, key):
+        path = os.path.join(self.directory, key)
+        found = os.path.isdir(path)
+
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return path if found else None
+
+    # Copies what was compiled in directory source in the cache. Returns the cached directory.
+    def put(self, key, source):
+        path = os.path.join(self.directory, key)
+        if os.path.isdir(path):
+            return path
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # copied aside and renamed, a half-written entry is never seen
+        staging = tempfile.mkdtemp(dir=self.directory)
+        try:
+            shutil.copytree(source, os.path.join(staging, 'modules'))
+            os.rename(os.path.join(staging, 'modules'), path)
+        except OSError:
+            # stored meanwhile by another load
+            if not os.path.isdir(path):
+                raise
+        finally:
+            shutil.rmtree(staging, True)
+
+        return path
+
+    def stats(self):
+        return "%d hits, %d misses (%s)" % (self.hits, self.misses, self.directory)
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Dependency graph of .proto files, followed before compiling so the whole closure goes through one protoc
+# run
+import hashlib
+import os
+import re
+
+# import "a/b.proto"; import public "c.proto"; import weak "d.proto";
+IMPORT_PATTERN = re.compile(r'^\s*import\s+(?:public\s+|weak\s+)?"([^"]+)"\s*;', re.MULTILINE)
+
+# Well-known types: known to protoc and shipped with the protobuf runtime
+BUILTIN_PREFIX = 'google/protobuf/'
+
+
+class ProtoGraphError(Exception):
+    pass
+
+
+def imports(source):
+    return IMPORT_PATTERN.findall(source)
+
+
+# Python module generated by protoc for the proto name (as seen from its root).
+def module_name(name):
+    return os.path.splitext(name)[0].replace('/', '.') + '_pb2'
+
+
+# Key of the types of the proto name among the loaded ones: its module, qualified by its package.
+def file_key(name, package):
+    # service.proto in every directory of a monorepo, each compiled from its own directory
+    module = module_name(name)
+    if package and not module.startswith(package + '.'):
+        module = '%s.%s' % (package, module)
+    return module
+
+
+def ancestors(directory):
+    while True:
+        yield directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+
+class ProtoFile(object):
+    __slots__ = ('name', 'root', 'digest', 'imports')
+
+    def __init__(self, name, root, source):
+        self.name = name
+        self.root = root
+        self.digest = hashlib.sha1(source).hexdigest()
+        self.imports = [name for name in imports(source) if not name.startswith(BUILTIN_PREFIX)]
+
+    @property
+    def path(self):
+        return os.path.join(self.root, self.name)
+
+
+class ProtoGraph(object):
+    # parsed: ProtoFiles by (root, name), shared by the graphs of protos loaded together.
+    def __init__(self, path, parsed=None):
+        path = os.path.abspath(path)
+        root, name = os.path.split(path)
+        self.parsed = parsed if parsed is not None else {}
+
+        # include roots in the order they were found, the one of the loaded proto first
+        self.roots = [root]
+        self.files = {}
+        # (importing proto, import not found)
+        self.missing = []
+        self.cycles = []
+
+        self.main = self._load(name, root)
+        self.order = self._sort()
+
+    def _load(self, name, root):
+        proto = self.parsed.get((root, name))
+        if proto is None:
+            with open(os.path.join(root, name), 'rb') as f:
+                proto = ProtoFile(name, root, f.read())
+            self.parsed[(root, name)] = proto
+        self.files[name] = proto
+
+        for imported in proto.imports:
+            if imported in self.files:
+                continue
+
+            found = self._find(imported, proto)
+            if found is None:
+                self.missing.append((proto.name, imported))
+                continue
+
+            if found not in self.roots:
+                self.roots.append(found)
+            self._load(imported, found)
+
+        return proto
+
+    def _find(self, name, importer):
+        directory = os.path.dirname(importer.path)
+        for root in [importer.root] + self.roots + list(ancestors(directory)):
+            if os.path.isfile(os.path.join(root, name)):
+                return root
+        return None
+
+    # Protos with their dependencies first, recording the cycles met on the way.
+    def _sort(self):
+        order = []
+        done = set()
+        visiting = []
+
+        def visit(proto):
+            if proto.name in done:
+                return
+            if proto.name in visiting:
+                self.cycles.append(visiting[visiting.index(proto.name):] + [proto.name])
+                return
+
+            visiting.append(proto.name)
+            for name in proto.imports:
+                if name in self.files:
+                    visit(self.files[name])
+            visiting.pop()
+
+            done.add(proto.name)
+            order.append(proto)
+
+        visit(self.main)
+        return order
+
+    @property
+    def valid(self):
+        return not self.missing and not self.cycles
+
+    def check(self):
+        problems = ['%s imports %s, not found' % (importer, name) for importer, name in self.missing]
+        problems.extend('import cycle: %s' % (' -> '.join(cycle), ) for cycle in self.cycles)
+
+        if problems:
+            raise ProtoGraphError('Cannot compile %s:\n%s' % (self.main.name, '\n'.join(problems)))
+
+    # Digest of every proto of the graph and of the protoc version compiling them.
+    def digest(self, version):
+        digest = hashlib.sha1(version)
+        for proto in sorted(self.order, key=lambda proto: proto.name):
+            digest.update('\0%s\0%s' % (proto.name, proto.digest))
+        digest.update('\0%s' % (self.main.name, ))
+        return digest.hexdigest()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# Protos found in the selected directories, filtered by glob patterns and deduplicated
+import fnmatch
+import hashlib
+import os
+import re
+from collections import OrderedDict
+
+# Files accepted as prebuilt descriptor sets
+DESCRIPTOR_SET_EXTENSIONS = ('.desc', '.pb', '.protoset')
+
+GENERATED_SUFFIX = '_pb2.py'
+
+
+def is_proto_file(name):
+    extension = os.path.splitext(name)[1]
+    return extension == '.proto' or extension in DESCRIPTOR_SET_EXTENSIONS or name.endswith(GENERATED_SUFFIX)
+
+
+# Glob patterns of a comma (or space) separated list.
+def split_globs(text):
+    return [pattern for pattern in re.split(r'[,\s]+', text or '') if pattern]
+
+
+# Regular expression matching any of the glob patterns, None if there is none.
+def compile_globs(patterns):
+    if not patterns:
+        return None
+    return re.compile('|'.join('(?:%s)' % (fnmatch.translate(pattern), ) for pattern in patterns))
+
+
+def _matches(globs, relative, name):
+    return globs is not None and (globs.match(relative) is not None or globs.match(name) is not None)
+
+
+# Protos under directory root in a deterministic order. include/exclude: lists of glob patterns.
+def walk_protos(root, include=None, exclude=None):
+    include = compile_globs(include)
+    exclude = compile_globs(exclude)
+
+    for directory, dirnames, filenames in os.walk(root):
+        relative = os.path.relpath(directory, root).replace(os.sep, '/')
+        prefix = '' if relative == '.' else relative + '/'
+
+        dirnames[:] = sorted(name for name in dirnames if not _matches(exclude, prefix + name, name))
+
+        for name in sorted(filenames):
+            if not is_proto_file(name):
+                continue
+            if include is not None and not _matches(include, prefix + name, name):
+                continue
+            if _matches(exclude, prefix + name, name):
+                continue
+            yield os.path.join(directory, name)
+
+
+def _digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except EnvironmentError:
+        # reported when it is loaded
+        return path
+
+
+# Absolute paths of paths without duplicates, in order.
+def unique_protos(paths):
+    files = OrderedDict()
+    for path in paths:
+        files.setdefault(os.path.realpath(path), os.path.abspath(path))
+
+    # a generated module is the same as the proto next to it
+    protos = set(path[:-len('.proto')] for path in files if path.endswith('.proto'))
+    for path in files.keys():
+        if path.endswith(GENERATED_SUFFIX) and path[:-len(GENERATED_SUFFIX)] in protos:
+            del files[path]
+
+    # only files sharing their size with another one are read
+    sizes = {}
+    for path in files:
+        try:
+            sizes.setdefault(os.path.getsize(path), []).append(path)
+        except OSError:
+            pass
+
+    seen = set()
+    for same_size in sizes.itervalues():
+        if len(same_size) < 2:
+            continue
+        for path in same_size:
+            digest = _digest(path)
+            if digest in seen:
+                del files[path]
+            seen.add(digest)
+
+    return files.values()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Change detection for the loaded protos and the files of their import graphs
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from proto_graph import ProtoGraph
+
+
+# (mtime, size, digest) of path, None if it cannot be read.
+def file_state(path):
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as f:
+            return stat.st_mtime, stat.st_size, hashlib.sha1(f.read()).hexdigest()
+    except EnvironmentError:
+        return None
+
+
+class ProtoWatcher(object):
+    def __init__(self):
+        # loaded proto -> paths of the files it is compiled from, None until they are scanned
+        self._protos = OrderedDict()
+        self._states = {}
+        self._lock = threading.Lock()
+
+    # Watches a loaded proto, again after a reload since its imports may have changed.
+    def watch(self, path):
+        with self._lock:
+            self._protos[path] = None
+
+    def _scan(self, path):
+        paths = [path]
+        if path.endswith('.proto'):
+            try:
+                paths = [proto.path for proto in ProtoGraph(path).order]
+            except EnvironmentError:
+                pass
+
+        for path in paths:
+            if path not in self._states:
+                self._states[path] = file_state(path)
+        return paths
+
+    def _modified(self, path):
+        state = self._states.get(path)
+
+        try:
+            stat = os.stat(path)
+            if state is not None and (stat.st_mtime, stat.st_size) == state[:2]:
+                return False
+        except OSError:
+            if state is None:
+                return False
+
+        new_state = file_state(path)
+        self._states[path] = new_state
+        return state is None or new_state is None or new_state[2] != state[2]
+
+    # Loaded protos to reload: the ones with a file changed since the previous poll. Called by one thread.
+    def changed(self):
+        with self._lock:
+            protos = self._protos.items()
+
+        scanned = [(proto, paths if paths is not None else self._scan(proto)) for proto, paths in protos]
+
+        with self._lock:
+            for proto, paths in scanned:
+                if proto in self._protos and self._protos[proto] is None:
+                    self._protos[proto] = paths
+
+        watched = set(path for _, paths in scanned for path in paths)
+        modified = set(path for path in watched if self._modified(path))
+
+        return [proto for proto, paths in scanned if modified.intersection(paths)]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# The protoc binary shipped with the extension, found and checked on first use
+import os
+import platform
+import subprocess
+import threading
+
+from java.lang import System
+
+
+class ProtocError(Exception):
+    pass
+
+
+def binary_name(system, arch):
+    if arch not in ('32bit', '64bit'):
+        raise ProtocError("Unrecognized operating system architecture: " + arch)
+
+    if system == "Linux":
+        return "protoc-linux-%s" % (arch[:2], )
+    elif system.startswith("Mac "):
+        return "protoc-mac-%s" % (arch[:2], )
+    elif system.startswith("Windows "):
+        return "protoc-windows.exe"
+    else:
+        raise ProtocError("Unrecognized operating system: " + system)
+
+
+class Protoc(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self._path = None
+        self._version = None
+        # not checked again once it failed, raw decoding of big bodies would run it for every message
+        self._error = None
+        self._lock = threading.Lock()
+
+    def _check(self):
+        path = os.path.join(self.directory, binary_name(System.getProperty('os.name'),
+                                                        platform.architecture()[0]))
+        if not path.endswith('.exe'):
+            try:
+                os.chmod(path, 0755)
+            except OSError:
+                # already executable, or it fails below
+                pass
+
+        try:
+            process = subprocess.Popen([path, '--version'],
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            output, error = process.communicate()
+        except OSError as error:
+            raise ProtocError("Error calling protoc: %s" % (error, ))
+
+        if error or not output.startswith('libprotoc'):
+            raise ProtocError("Error calling protoc: %s" % (error or output, ))
+
+        return path, output.strip()
+
+    # Path of protoc, run once with --version the first time. Raises ProtocError if it does not work.
+    def path(self):
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if self._path is None:
+                try:
+                    self._path, self._version = self._check()
+                except ProtocError as error:
+                    self._error = error
+                    raise
+            return self._path
+
+    def failed(self):
+        return self._error is not None
+
+    def version(self):
+        self.path()
+        return self._version
+
+    # Output of protoc --decode_raw for data, its error message if data is not a message.
+    def decode_raw(self, data):
+        try:
+            process = subprocess.Popen([self.path(), '--decode_raw'],
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            output, error = process.communicate(data)
+        except OSError as error:
+            raise ProtocError("Error calling protoc: %s" % (error, ))
+
+        return error.strip() if process.returncode else output
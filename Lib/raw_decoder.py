@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Schema-less protobuf decoding, same output as protoc --decode_raw
+import struct
+
+from google.protobuf.internal import decoder
+from google.protobuf.internal import wire_format
+from google.protobuf.message import DecodeError
+
+# Same text protoc writes on stderr when --decode_raw cannot parse its input
+PARSE_ERROR = 'Failed to parse input.'
+
+# Mirrors protoc's default recursion limit
+MAX_DEPTH = 100
+
+# protoc reads tags of at most 5 bytes
+MAX_TAG_SIZE = 5
+
+_VARINT = wire_format.WIRETYPE_VARINT
+_FIXED64 = wire_format.WIRETYPE_FIXED64
+_LENGTH_DELIMITED = wire_format.WIRETYPE_LENGTH_DELIMITED
+_START_GROUP = wire_format.WIRETYPE_START_GROUP
+_END_GROUP = wire_format.WIRETYPE_END_GROUP
+_FIXED32 = wire_format.WIRETYPE_FIXED32
+
+# Decoded (field number, wire type) per raw tag, a message only uses a few
+_TAGS = {}
+_MAX_TAGS = 4096
+
+# C-style escaping table, same as protobuf's CEscape()
+_ESCAPES = []
+for _byte in range(256):
+    if 0x20 <= _byte < 0x7f:
+        _ESCAPES.append(chr(_byte))
+    else:
+        _ESCAPES.append('\\%03o' % (_byte, ))
+for _byte, _escaped in (('\n', '\\n'), ('\r', '\\r'), ('\t', '\\t'),
+                        ('"', '\\"'), ("'", "\\'"), ('\\', '\\\\')):
+    _ESCAPES[ord(_byte)] = _escaped
+del _byte, _escaped
+
+
+def c_escape(value):
+    return ''.join([_ESCAPES[b] for b in bytearray(value)])
+
+
+# Parse an unknown field set from buffer[pos:end]. Returns a list of (field_number, wire_type, value) tuples. Length
+# delimited values are kept as (start, end) offsets into buffer so that nested messages are parsed without copying;
+# groups hold their own field list. Raises DecodeError on anything protoc would reject.
+def parse_fields(buffer, pos, end, depth=0):
+    fields, pos = _parse_fields(buffer, pos, end, None, depth)
+    if pos != end:
+        raise DecodeError('Unexpected end-group tag.')
+    return fields
+
+
+def _parse_fields(buffer, pos, end, group_number, depth):
+    if depth > MAX_DEPTH:
+        raise DecodeError('Message too deep.')
+
+    fields = []
+    append = fields.append
+
+    try:
+        while pos < end:
+            tag_bytes, pos = decoder.ReadTag(buffer, pos)
+            try:
+                field_number, wire_type = _TAGS[tag_bytes]
+            except KeyError:
+                # protoc reads tags as 32 bit varints, dropping the upper bits
+                if len(tag_bytes) > MAX_TAG_SIZE:
+                    raise DecodeError('Tag too long.')
+                tag, _ = decoder._DecodeVarint32(tag_bytes, 0)
+                field_number, wire_type = wire_format.UnpackTag(tag)
+                if len(_TAGS) < _MAX_TAGS:
+                    _TAGS[tag_bytes] = (field_number, wire_type)
+
+            if field_number == 0:
+                raise DecodeError('Field number 0 is illegal.')
+
+            if wire_type == _LENGTH_DELIMITED:
+                size, pos = decoder._DecodeVarint(buffer, pos)
+                value = (pos, pos + size)
+                pos += size
+            elif wire_type == _START_GROUP:
+                value, pos = _parse_fields(buffer, pos, end, field_number,
+                                           depth + 1)
+            elif wire_type == _END_GROUP:
+                if field_number != group_number:
+                    raise DecodeError('Unexpected end-group tag.')
+                return fields, pos
+            else:
+                value, pos = decoder._DecodeUnknownField(buffer, pos,
+                                                         wire_type)
+
+            if pos > end:
+                raise DecodeError('Truncated message.')
+
+            append((field_number, wire_type, value))
+
+    except (IndexError, TypeError, struct.error):
+        raise DecodeError('Truncated message.')
+
+    if group_number is not None:
+        raise DecodeError('Missing end-group tag.')
+
+    return fields, pos
+
+
+def _render(buffer, fields, indent, lines, depth):
+    for field_number, wire_type, value in fields:
+        if wire_type == _VARINT:
+            lines.append('%s%d: %d' % (indent, field_number, value))
+
+        elif wire_type == _FIXED32:
+            lines.append('%s%d: 0x%08x' % (indent, field_number, value))
+
+        elif wire_type == _FIXED64:
+            lines.append('%s%d: 0x%016x' % (indent, field_number, value))
+
+        elif wire_type == _START_GROUP:
+            lines.append('%s%d {' % (indent, field_number))
+            _render(buffer, value, indent + '  ', lines, depth + 1)
+            lines.append('%s}' % (indent, ))
+
+        else:
+            start, stop = value
+            embedded = None
+
+            # Like protoc, anything that parses as a non-empty message is
+            # shown as a nested message, everything else as a string
+            if stop > start and depth < MAX_DEPTH:
+                try:
+                    embedded = parse_fields(buffer, start, stop, depth + 1)
+                except DecodeError:
+                    embedded = None
+
+            if embedded:
+                lines.append('%s%d {' % (indent, field_number))
+                _render(buffer, embedded, indent + '  ', lines, depth + 1)
+                lines.append('%s}' % (indent, ))
+            else:
+                lines.append('%s%d: "%s"' % (
+                    indent, field_number,
+                    c_escape(buffer[start:stop].tobytes())))
+
+    return lines
+
+
+# Return the text protoc --decode_raw would print for data.
+def decode_raw(data):
+    buffer = memoryview(data)
+    fields = parse_fields(buffer, 0, len(buffer))
+    lines = _render(buffer, fields, '', [], 0)
+    if not lines:
+        return ''
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# Message types of endpoints, matched by host, method, path glob and direction
+import fnmatch
+import re
+
+DIRECTIONS = ('Both', 'Request', 'Response')
+
+GLOB_CHARACTERS = re.compile(r'[*?\[]')
+
+GLOB_WILDCARDS = re.compile(r'\[[^\]]*\]|[*?]')
+
+
+# Regular expression of a glob pattern, None if it matches anything.
+def _glob(pattern):
+    pattern = pattern.strip()
+    if pattern in ('', '*'):
+        return None
+    return re.compile(fnmatch.translate(pattern), re.IGNORECASE)
+
+
+def request_path(path):
+    return path.split('?', 1)[0]
+
+
+class Route(object):
+    __slots__ = ('host', 'path', 'method', 'direction', 'message_type', '_host')
+
+    def __init__(self, host, path, method, direction, message_type):
+        self.host = host.strip()
+        # '?' is a glob character here, not the start of a query string
+        self.path = path.strip() or '*'
+        self.method = method.strip().upper()
+        self.direction = direction
+        self.message_type = message_type.strip()
+
+        self._host = _glob(self.host)
+
+    def accepts(self, host, method, is_request):
+        if self.direction != 'Both' and (self.direction == 'Request') != is_request:
+            return False
+        if self.method not in ('', '*') and self.method != method.upper():
+            return False
+        return self._host is None or self._host.match(host) is not None
+
+
+# Exact paths in a dict, paths ending with '*' in a character trie walked once along the path, other globs as regular
+# expressions
+class Router(object):
+    def __init__(self, routes):
+        self.exact = {}
+        # character -> child node, None -> routes of the prefix ending there
+        self.trie = {}
+        self.patterns = []
+        self.count = 0
+
+        for route in routes:
+            if not route.message_type:
+                continue
+            self.count += 1
+
+            path = route.path
+            wildcards = GLOB_CHARACTERS.search(path)
+
+            if wildcards is None:
+                self.exact.setdefault(path, []).append(route)
+
+            elif wildcards.start() == len(path) - 1 and path.endswith('*'):
+                node = self.trie
+                for character in path[:-1]:
+                    node = node.setdefault(character, {})
+                node.setdefault(None, []).append(route)
+
+            else:
+                self.patterns.append((len(GLOB_WILDCARDS.sub('', path)), _glob(path), route))
+
+        # most literal characters first, in table order
+        self.patterns.sort(key=lambda pattern: -pattern[0])
+
+    def __len__(self):
+        return self.count
+
+    # (length, routes) of the prefixes of path.
+    def _prefixes(self, path):
+        found = []
+        node = self.trie
+        if None in node:
+            found.append((0, node[None]))
+
+        for length, character in enumerate(path, 1):
+            node = node.get(character)
+            if node is None:
+                break
+            if None in node:
+                found.append((length, node[None]))
+
+        return found
+
+    # Full name of the message type of the endpoint, None if no route matches. An exact path wins, then the most
+    # specific prefix or pattern; a route for any path is only used when nothing more specific matches.
+    def match(self, host, method, path, is_request):
+        path = request_path(path)
+
+        for route in self.exact.get(path, ()):
+            if route.accepts(host, method, is_request):
+                return route.message_type
+
+        # prefixes and patterns by specificity, a prefix before a pattern as specific
+        matching = [(length, 0, routes) for length, routes in self._prefixes(path)]
+        matching.extend((literals, 1, [route]) for literals, pattern, route in self.patterns
+                        if pattern is None or pattern.match(path) is not None)
+        matching.sort(key=lambda match: (-match[0], match[1]))
+
+        for _, _, routes in matching:
+            for route in routes:
+                if route.accepts(host, method, is_request):
+                    return route.message_type
+
+        return None
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+# Index of the (field number, wire type) pairs of the loaded message types, to rank the types of a body
+import struct
+
+from google.protobuf.internal import decoder
+from google.protobuf.internal import type_checkers
+from google.protobuf.internal import wire_format
+from google.protobuf.message import DecodeError
+from google.protobuf.descriptor import FieldDescriptor
+
+# Distinct top-level (field, wire type) pairs looked at, enough to tell types apart
+SCAN_LIMIT = 256
+
+# Top-level fields read at most, so that a long repeated field is not scanned to its end
+SCAN_FIELDS = 1024
+
+# Best candidates checked against nested messages too, and how deep/how many fields
+REFINE_CANDIDATES = 8
+REFINE_DEPTH = 3
+REFINE_BUDGET = 2048
+
+
+def wire_types(field):
+    types = [type_checkers.FIELD_TYPE_TO_WIRE_TYPE[field.type]]
+
+    # repeated scalars may be packed or not, whatever the proto says
+    if field.label == FieldDescriptor.LABEL_REPEATED and wire_format.IsTypePackable(field.type):
+        types.append(wire_format.WIRETYPE_LENGTH_DELIMITED)
+    return types
+
+
+def signature(message_type):
+    return frozenset((field.number, wire_type)
+                     for field in message_type.fields for wire_type in wire_types(field))
+
+
+# Fields of buffer[pos:end] that don't fit message_type, looking into nested messages (found in types).
+def mismatches(types, message_type, buffer, pos, end, depth, budget):
+    fields = message_type.fields_by_number
+    unknown = 0
+
+    try:
+        while pos < end and budget[0] > 0:
+            budget[0] -= 1
+            tag_bytes, pos = decoder.ReadTag(buffer, pos)
+            tag, _ = decoder._DecodeVarint32(tag_bytes, 0)
+            field_number, wire_type = wire_format.UnpackTag(tag)
+
+            start = pos
+            pos = decoder.SkipField(buffer, pos, end, tag_bytes)
+            if field_number == 0 or pos == -1 or pos > end:
+                return unknown + SCAN_LIMIT
+
+            field = fields.get(field_number)
+            if field is None or wire_type not in wire_types(field):
+                unknown += 1
+            elif depth and field.message_type in types and wire_type == wire_format.WIRETYPE_LENGTH_DELIMITED:
+                _, start = decoder._DecodeVarint(buffer, start)
+                unknown += mismatches(types, types[field.message_type], buffer, start, pos, depth - 1, budget)
+    except (IndexError, TypeError, struct.error, DecodeError):
+        return unknown + SCAN_LIMIT
+
+    return unknown
+
+
+# Distinct (field number, wire type) pairs of the first top-level fields, None if buffer is not a message.
+def scan(buffer, limit=SCAN_LIMIT, fields=SCAN_FIELDS):
+    pairs = set()
+    pos = 0
+    end = len(buffer)
+
+    try:
+        while pos < end and len(pairs) < limit and fields > 0:
+            fields -= 1
+            tag_bytes, pos = decoder.ReadTag(buffer, pos)
+            tag, _ = decoder._DecodeVarint32(tag_bytes, 0)
+            field_number, wire_type = wire_format.UnpackTag(tag)
+            if field_number == 0:
+                return None
+
+            pos = decoder.SkipField(buffer, pos, end, tag_bytes)
+            if pos == -1 or pos > end:
+                return None
+
+            pairs.add((field_number, wire_type))
+    except (IndexError, TypeError, struct.error, DecodeError):
+        return None
+
+    return pairs
+
+
+class Candidate(object):
+    __slots__ = ('message_type', 'matched', 'unknown', 'size', 'nested')
+
+    def __init__(self, message_type, matched, unknown, size):
+        self.message_type = message_type
+        self.matched = matched
+        self.unknown = unknown
+        self.size = size
+        # mismatches found in nested messages, only computed for the best candidates
+        self.nested = None
+
+    @property
+    def perfect(self):
+        # every field of the body is a field of the type
+        return self.unknown == 0 and not self.nested
+
+    def key(self):
+        # fewest unknown fields, then most matched, then the tightest type
+        return (self.unknown, self.nested, -self.matched, self.size)
+
+
+# Immutable once built: rebuilt and swapped when protos are loaded.
+class TypeIndex(object):
+    def __init__(self, message_types=()):
+        self.message_types = []
+        self.sizes = []
+        self.postings = {}
+        # every type by full name, for nested messages
+        self.types = {}
+
+        for message_type in message_types:
+            self._add(message_type)
+
+    def _add(self, message_type):
+        if message_type.full_name in self.types:
+            return
+        self.types[message_type.full_name] = message_type
+
+        # map entries are not messages one would send
+        if not message_type.map_entry:
+            index = len(self.message_types)
+            pairs = signature(message_type)
+            self.message_types.append(message_type)
+            self.sizes.append(len(pairs))
+            for pair in pairs:
+                self.postings.setdefault(pair, []).append(index)
+
+        for nested in message_type.nested_types:
+            self._add(nested)
+
+    def __len__(self):
+        return len(self.message_types)
+
+    # Candidates for buffer, best first.
+    def rank(self, buffer, limit=10):
+        pairs = scan(buffer)
+        if not pairs:
+            return []
+
+        matched = {}
+        for pair in pairs:
+            for index in self.postings.get(pair, ()):
+                matched[index] = matched.get(index, 0) + 1
+
+        candidates = [Candidate(self.message_types[index], count, len(pairs) - count, self.sizes[index])
+                      for index, count in matched.iteritems()]
+        candidates.sort(key=Candidate.key)
+
+        # top-level fields often match several types: tell them apart with nested messages
+        best = candidates[:REFINE_CANDIDATES]
+        for candidate in best:
+            candidate.nested = mismatches(self.types, candidate.message_type, buffer, 0, len(buffer),
+                                          REFINE_DEPTH, [REFINE_BUDGET])
+        best.sort(key=Candidate.key)
+
+        return (best + candidates[REFINE_CANDIDATES:])[:limit]
+
+    # (best candidate or None, candidates); best only if perfect and not tied with the next one.
+    def detect(self, buffer, limit=10):
+        candidates = self.rank(buffer, limit)
+        if not candidates or not candidates[0].perfect:
+            return None, candidates
+        if len(candidates) > 1 and candidates[0].key() == candidates[1].key():
+            return None, candidates
+        return candidates[0], candidates
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+# Search of the loaded message types by name, for the "Filter .proto" menu and the type picker
+import re
+import threading
+from collections import OrderedDict
+
+REGEX_CHARACTERS = re.compile(r'[.*+?^$()\[\]{}|\\]')
+
+# Results kept, the type picker searches every prefix of what is typed
+CACHED_RESULTS = 32
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+class SearchResult(object):
+    __slots__ = ('search', 'entries', '_visible')
+
+    def __init__(self, search, entries):
+        self.search = search
+        # matching entries, best first
+        self.entries = entries
+        self._visible = None
+
+    # The count best matching types.
+    def best(self, count=None):
+        return [self.search.types[entry] for entry in self.entries[:count]]
+
+    # Types to show in the menu tree: the matches, the types nested in them and the types enclosing them.
+    @property
+    def visible(self):
+        if self._visible is None:
+            self._visible = self.search._visible(self.entries)
+        return self._visible
+
+
+class TypeSearch(object):
+    # descriptors: message types by name, by module name (as the extender holds them).
+    def __init__(self, descriptors):
+        self.descriptors = descriptors
+
+        self.types = []
+        self.modules = []
+        self.packages = []
+        self.names = []
+        self.full_names = []
+        # entry of the enclosing type, -1 for top-level ones
+        self.parents = []
+        # entries of the types nested in entry i are i + 1 to ends[i] - 1
+        self.ends = []
+
+        for module, types in descriptors.iteritems():
+            self._add(module, types, -1)
+
+        self._parts = None
+        self._trigrams = None
+        self._results = OrderedDict()
+        # searched from the menus and from the type picker worker
+        self._lock = threading.Lock()
+
+    def _add(self, module, types, parent):
+        for message_type in types.itervalues():
+            entry = len(self.types)
+            self.types.append(message_type)
+            self.modules.append(module)
+            if parent == -1:
+                self.packages.append(message_type.full_name[:-len(message_type.name)].rstrip('.'))
+            else:
+                self.packages.append(self.packages[parent])
+            self.names.append(message_type.name.lower())
+            self.full_names.append(message_type.full_name.lower())
+            self.parents.append(parent)
+            self.ends.append(None)
+
+            self._add(module, message_type.nested_types_by_name, entry)
+            self.ends[entry] = len(self.types)
+
+    def _index(self):
+        if self._trigrams is None:
+            # part of full name -> entries whose full name has it
+            self._parts = {}
+            for entry, full_name in enumerate(self.full_names):
+                for part in full_name.split('.'):
+                    self._parts.setdefault(part, []).append(entry)
+
+            self._trigrams = {}
+            for part in self._parts:
+                for trigram in trigrams(part):
+                    self._trigrams.setdefault(trigram, []).append(part)
+
+        return self._trigrams
+
+    # Builds the index now (on a loading worker) rather than on the first query.
+    def prepare(self):
+        self._index()
+        return self
+
+    def _containing(self, query):
+        # a query spanning parts is not in the index
+        if len(query) < 3 or '.' in query:
+            return [entry for entry, full_name in enumerate(self.full_names) if query in full_name]
+
+        index = self._index()
+        postings = sorted((index.get(trigram, ()) for trigram in trigrams(query)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+
+        entries = set()
+        for part in candidates:
+            if query in part:
+                entries.update(self._parts[part])
+        return entries
+
+    def _fuzzy(self, query):
+        # type names only, the characters of a query spread over the package would match almost anything
+        fuzzy = re.compile('.*?'.join(re.escape(character) for character in query))
+        names = {}
+        for entry, name in enumerate(self.names):
+            names.setdefault(name, []).append(entry)
+        return [entry for name, entries in names.iteritems() if fuzzy.search(name) for entry in entries]
+
+    def _rank(self, query, entry):
+        name = self.names[entry]
+        if name == query:
+            return 0
+        if name.startswith(query):
+            return 1
+        if query in name:
+            return 2
+        return 3
+
+    def _search(self, text):
+        query = text.strip().lower()
+
+        if REGEX_CHARACTERS.search(query):
+            try:
+                pattern = re.compile(text.strip(), re.IGNORECASE)
+            except re.error:
+                pattern = re.compile(re.escape(query))
+            ranked = [(2 if pattern.search(self.names[entry]) else 3, entry)
+                      for entry, full_name in enumerate(self.full_names) if pattern.search(full_name)]
+
+        else:
+            ranked = [(self._rank(query, entry), entry) for entry in self._containing(query)]
+
+            if not ranked:
+                ranked = [(4, entry) for entry in self._fuzzy(query)]
+
+        ranked.sort(key=lambda match: (match[0], len(self.full_names[match[1]]), match[1]))
+        return SearchResult(self, [entry for _, entry in ranked])
+
+    def _visible(self, entries):
+        visible = set()
+        for entry in entries:
+            visible.update(xrange(entry, self.ends[entry]))
+            parent = self.parents[entry]
+            while parent != -1 and parent not in visible:
+                visible.add(parent)
+                parent = self.parents[parent]
+
+        return set(self.types[entry] for entry in visible)
+
+    # SearchResult of the query text, kept until the next load replaces the index.
+    # Ranked by exact name, name prefix, name substring, full name substring, and fuzzy only when nothing contains
+    # the query. A query with regular expression characters is matched as a regular expression.
+    def search(self, text):
+        with self._lock:
+            result = self._results.pop(text, None)
+            if result is None:
+                result = self._search(text)
+                if len(self._results) >= CACHED_RESULTS:
+                    self._results.popitem(last=False)
+            self._results[text] = result
+            return result
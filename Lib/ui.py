@@ -1,10 +1,12 @@
-from java.awt import Dimension, GridBagConstraints, GridBagLayout, Insets
-from java.awt.event import ActionListener
-from java.lang import Boolean, Double
+from java.awt import BorderLayout, Dimension, GridBagConstraints, GridBagLayout, Insets
+from java.awt.event import ActionListener, MouseAdapter, WindowAdapter
+from java.lang import Boolean, Double, Integer, Runnable, String
+from java.util.concurrent import Executors
 
-from javax.swing import DefaultCellEditor, JButton, \
-        JComboBox, JPanel, JScrollPane, JTable
-from javax.swing.table import DefaultTableModel, TableRowSorter
+from javax.swing import DefaultCellEditor, JButton, JComboBox, JDialog, JLabel, JPanel, JProgressBar, JScrollPane, \
+        JTable, JTextArea, JTextField, ListSelectionModel, SwingUtilities, WindowConstants
+from javax.swing.event import DocumentListener, TableModelListener
+from javax.swing.table import AbstractTableModel, DefaultTableModel, TableRowSorter
 
 from burp import IParameter
 
@@ -14,6 +16,9 @@ from zlib import compress, decompress
 
 from urllib import unquote, quote_plus
 
+from parameter_rules import ParameterRules
+from routes import DIRECTIONS, Route, Router
+
 def decode_url_and_base64(to_decode):
     return b64decode(unquote(to_decode).decode('utf8'))
 
@@ -51,6 +56,10 @@ class ParameterProcessingRulesTable(JPanel):
         self.extender = extender
 
         self.table = table = JTable(ParameterProcessingRulesTableModel(*rows))
+
+        # Rules are compiled once and compiled again only after the table changes
+        self._rules = self.compileRules()
+        table.getModel().addTableModelListener(RulesChangedListener(self))
         table.setPreferredScrollableViewportSize(Dimension(500, 70))
         table.setRowSorter(TableRowSorter(table.getModel()))
         table.setFillsViewportHeight(True)
@@ -152,12 +161,21 @@ class ParameterProcessingRulesTable(JPanel):
 
         return
 
-    def getParameterRules(self):
-        rules = {}
+    # Called on the Swing event thread, where the table is edited
+    def compileRules(self):
+        rows = []
         for ptype, name, when, rule, enabled in self.table.getModel().data:
-            if enabled:
-                rules.setdefault(name, {}).setdefault(when.lower(), []).append(RULES.get(rule, ''))
-        return rules
+            if enabled and ptype in PARAMETER_TYPES:
+                # no processing for the empty rule
+                rows.append((PARAMETER_TYPES[ptype], name, when.lower(), RULES.get(rule) if rule else None))
+        return ParameterRules(rows)
+
+    def invalidateRules(self):
+        # readers keep the rules they took, the new ones replace them as a whole
+        self._rules = self.compileRules()
+
+    def getParameterRules(self):
+        return self._rules
 
     @property
     def rules(self):
@@ -198,7 +216,7 @@ class ParameterProcessingRulesTableModel(DefaultTableModel):
         return True
 
     def addRow(self, row=None):
-        self.data.append(row or ['PARAM_BODY', '', 'Before', '', Boolean(0)])
+        self.data.append(row or list(self.DEFAULT_VALUES))
         self.fireTableRowsInserted(len(self.data) - 1, len(self.data) - 1)
         return
 
@@ -228,6 +246,15 @@ class ParameterProcessingRulesTableModel(DefaultTableModel):
         return True
 
 
+class RulesChangedListener(TableModelListener):
+    def __init__(self, rulesTable):
+        self.rulesTable = rulesTable
+
+    def tableChanged(self, event):
+        self.rulesTable.invalidateRules()
+        return
+
+
 class AddRemoveParameterListener(ActionListener):
     def __init__(self, table):
         self.table = table
@@ -247,3 +274,367 @@ class AddRemoveParameterListener(ActionListener):
             if self.table.getModel().moveRowDown(row):
                 self.table.setRowSelectionInterval(row + 1, row + 1)
         return
+
+
+# Routes of endpoints to message types, compiled in a Router rebuilt only after the table changes.
+class RoutesTable(JPanel):
+    def __init__(self, *rows):
+        self.version = 0
+        self._router = None
+
+        self.table = table = JTable(RoutesTableModel(*rows))
+        table.getModel().addTableModelListener(RoutesChangedListener(self))
+        table.setPreferredScrollableViewportSize(Dimension(500, 70))
+        table.setFillsViewportHeight(True)
+
+        directions = JComboBox(list(DIRECTIONS))
+        table.getColumnModel().getColumn(3).setCellEditor(DefaultCellEditor(directions))
+        table.getColumnModel().getColumn(1).setPreferredWidth(200)
+        table.getColumnModel().getColumn(4).setPreferredWidth(200)
+
+        buttons = JPanel(GridBagLayout())
+        labels = ("Add", "Remove", "Up", "Down")
+        for row, label in enumerate(labels):
+            button = JButton(label)
+            button.addActionListener(AddRemoveParameterListener(table))
+            buttonConstraints = GridBagConstraints()
+            buttonConstraints.fill = GridBagConstraints.HORIZONTAL
+            buttonConstraints.anchor = GridBagConstraints.NORTH
+            buttonConstraints.insets = Insets(0, 0, 5, 5)
+            buttonConstraints.gridy = row
+            buttonConstraints.weighty = 1.0 if row == len(labels) - 1 else 0.0
+            buttons.add(button, buttonConstraints)
+
+        self.setLayout(BorderLayout(5, 5))
+        self.add(JLabel("Message types of endpoints (Host and Path are globs, empty for any)"), BorderLayout.NORTH)
+        self.add(buttons, BorderLayout.WEST)
+        self.add(JScrollPane(table), BorderLayout.CENTER)
+
+    def invalidateRouter(self):
+        self.version += 1
+        self._router = None
+
+    def getRouter(self):
+        router = self._router
+        if router is None:
+            version = self.version
+            router = Router(Route(*row[:5]) for row in self.routes if row[5])
+            # don't publish a router built from a table that changed meanwhile
+            if version == self.version:
+                self._router = router
+        return router
+
+    def addRoute(self, host, path, method, direction, message_type):
+        self.table.getModel().addRow([host, path, method, direction, message_type, Boolean(1)])
+
+    @property
+    def routes(self):
+        return self.table.getModel().data
+
+
+class RoutesTableModel(ParameterProcessingRulesTableModel):
+    DEFAULT_VALUES = ('', '', '', 'Both', '', Boolean(1))
+    COLUMN_NAMES = ('Host', 'Path', 'Method', 'Direction', 'Message type', 'Enabled')
+
+
+class RoutesChangedListener(TableModelListener):
+    def __init__(self, routesTable):
+        self.routesTable = routesTable
+
+    def tableChanged(self, event):
+        self.routesTable.invalidateRouter()
+        return
+
+
+# Progress of the proto loads. Only updated on the Swing event thread, through LoadingProgress.
+class ProtoLoadingPanel(JPanel):
+    def __init__(self):
+        self.progress = None
+
+        self.progressBar = JProgressBar()
+        self.progressBar.setStringPainted(True)
+        self.progressBar.setString("")
+
+        self.cancelButton = JButton("Cancel")
+        self.cancelButton.addActionListener(CancelLoadingListener(self))
+        self.cancelButton.setEnabled(False)
+
+        self.status = JLabel("No .proto loaded")
+
+        self.errors = JTextArea(5, 80)
+        self.errors.setEditable(False)
+
+        bar = JPanel(BorderLayout(5, 5))
+        bar.add(self.progressBar, BorderLayout.CENTER)
+        bar.add(self.cancelButton, BorderLayout.EAST)
+
+        self.setLayout(BorderLayout(5, 5))
+        self.add(bar, BorderLayout.NORTH)
+        self.add(self.status, BorderLayout.CENTER)
+        self.add(JScrollPane(self.errors), BorderLayout.SOUTH)
+
+    def scanning(self, progress, directory):
+        self.progress = progress
+        self.errors.setText("")
+        self.progressBar.setIndeterminate(True)
+        self.progressBar.setString("%s: scanning" % (progress.title, ))
+        self.status.setText(directory)
+        self.cancelButton.setEnabled(True)
+
+    def started(self, progress, total):
+        self.progress = progress
+        self.errors.setText("")
+        self.progressBar.setIndeterminate(False)
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(0)
+        self.progressBar.setString("%s: 0/%d" % (progress.title, total))
+        self.cancelButton.setEnabled(True)
+
+    def advanced(self, progress, done, total, current):
+        if progress is not self.progress:
+            return
+        # protos left to an import that failed are added to the load
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(done)
+        self.progressBar.setString("%s: %d/%d" % (progress.title, done, total))
+        self.status.setText(current or "")
+
+    def failed(self, progress, error):
+        if progress is not self.progress:
+            return
+        self.errors.append(error.rstrip('\n') + '\n')
+
+    def finished(self, progress, message):
+        if progress is not self.progress:
+            return
+        self.progress = None
+        self.progressBar.setIndeterminate(False)
+        self.progressBar.setString("")
+        self.progressBar.setValue(0)
+        self.status.setText(message)
+        self.cancelButton.setEnabled(False)
+
+
+# Reports a load to the panel from the loading thread, and tells it whether the user cancelled it.
+class LoadingProgress(object):
+    def __init__(self, panel, title):
+        self.panel = panel
+        self.title = title
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def scan(self, directory):
+        SwingUtilities.invokeLater(lambda: self.panel.scanning(self, directory))
+
+    def start(self, total):
+        SwingUtilities.invokeLater(lambda: self.panel.started(self, total))
+
+    def advance(self, done, total, current):
+        SwingUtilities.invokeLater(lambda: self.panel.advanced(self, done, total, current))
+
+    def fail(self, error):
+        SwingUtilities.invokeLater(lambda: self.panel.failed(self, error))
+
+    def finish(self, message):
+        SwingUtilities.invokeLater(lambda: self.panel.finished(self, message))
+
+
+class CancelLoadingListener(ActionListener):
+    def __init__(self, panel):
+        self.panel = panel
+
+    def actionPerformed(self, event):
+        if self.panel.progress is not None:
+            self.panel.progress.cancel()
+            self.panel.status.setText("Cancelling...")
+        return
+
+
+# Include and exclude glob patterns of the directories to load, shown next to the file chooser.
+class ScanPatternsPanel(JPanel):
+    def __init__(self, include, exclude):
+        self.include = JTextField(include, 20)
+        self.exclude = JTextField(exclude, 20)
+
+        self.setLayout(GridBagLayout())
+        for row, (label, field) in enumerate([("Include (in directories):", self.include),
+                                              ("Exclude:", self.exclude)]):
+            labelConstraints = GridBagConstraints()
+            labelConstraints.gridy = row * 2
+            labelConstraints.anchor = GridBagConstraints.WEST
+            labelConstraints.insets = Insets(5, 5, 0, 5)
+            self.add(JLabel(label), labelConstraints)
+
+            fieldConstraints = GridBagConstraints()
+            fieldConstraints.gridy = row * 2 + 1
+            fieldConstraints.fill = GridBagConstraints.HORIZONTAL
+            fieldConstraints.insets = Insets(0, 5, 0, 5)
+            self.add(field, fieldConstraints)
+
+        hint = JLabel("Globs, comma separated")
+        hintConstraints = GridBagConstraints()
+        hintConstraints.gridy = 4
+        hintConstraints.anchor = GridBagConstraints.WEST
+        hintConstraints.insets = Insets(5, 5, 0, 5)
+        self.add(hint, hintConstraints)
+
+
+# Rows of the type picker. Only the rows on screen are read, whatever the number of types.
+class TypeTableModel(AbstractTableModel):
+    COLUMNS = ("Type", "Package", "File", "Fields")
+
+    def __init__(self, search):
+        self.search = search
+        # entries of the search shown, in order
+        self.entries = xrange(len(search.types))
+
+    def setEntries(self, entries):
+        self.entries = entries
+        self.fireTableDataChanged()
+
+    def getRowCount(self):
+        return len(self.entries)
+
+    def getColumnCount(self):
+        return len(self.COLUMNS)
+
+    def getColumnName(self, column):
+        return self.COLUMNS[column]
+
+    def getColumnClass(self, column):
+        return Integer if column == 3 else String
+
+    def getValueAt(self, row, column):
+        entry = self.entries[row]
+        if column == 0:
+            return self.search.types[entry].full_name
+        elif column == 1:
+            return self.search.packages[entry]
+        elif column == 2:
+            return self.search.modules[entry]
+        return len(self.search.types[entry].fields)
+
+    def typeAt(self, row):
+        return self.search.types[self.entries[row]]
+
+
+# Every loaded message type, filtered while typing. The filter runs on a worker thread, only the result of the last
+# keystroke is shown. choose(message_type) is called with the picked type.
+class TypePickerDialog(JDialog):
+    def __init__(self, owner, search, choose):
+        JDialog.__init__(self, owner, "Deserialize As...")
+        self.search = search
+        self.choose = choose
+
+        # keystrokes are numbered, results of older ones are dropped
+        self.sequence = 0
+        self.executor = Executors.newSingleThreadExecutor()
+
+        self.query = JTextField(40)
+        self.query.getDocument().addDocumentListener(TypeQueryListener(self))
+        self.query.addActionListener(PickTypeListener(self))
+
+        self.model = TypeTableModel(search)
+        self.table = JTable(self.model)
+        self.table.setSelectionMode(ListSelectionModel.SINGLE_SELECTION)
+        self.table.setFillsViewportHeight(True)
+        self.table.getColumnModel().getColumn(0).setPreferredWidth(350)
+        self.table.getColumnModel().getColumn(1).setPreferredWidth(150)
+        self.table.getColumnModel().getColumn(2).setPreferredWidth(200)
+        self.table.getColumnModel().getColumn(3).setPreferredWidth(50)
+        self.table.addMouseListener(PickTypeListener(self))
+
+        self.count = JLabel()
+        pickButton = JButton("Deserialize")
+        pickButton.addActionListener(PickTypeListener(self))
+
+        bottom = JPanel(BorderLayout(5, 5))
+        bottom.add(self.count, BorderLayout.CENTER)
+        bottom.add(pickButton, BorderLayout.EAST)
+
+        panel = JPanel(BorderLayout(5, 5))
+        panel.add(self.query, BorderLayout.NORTH)
+        panel.add(JScrollPane(self.table), BorderLayout.CENTER)
+        panel.add(bottom, BorderLayout.SOUTH)
+        self.getContentPane().add(panel)
+
+        self.setDefaultCloseOperation(WindowConstants.DISPOSE_ON_CLOSE)
+        self.addWindowListener(TypePickerClosedListener(self))
+        self.filtered(self.sequence, self.model.entries)
+        self.setSize(800, 500)
+        self.setLocationRelativeTo(owner)
+
+    def refresh(self):
+        self.sequence += 1
+        self.executor.submit(FilterTypesTask(self, self.sequence, self.query.getText()))
+
+    def filtered(self, sequence, entries):
+        if sequence != self.sequence:
+            return
+        self.model.setEntries(entries)
+        if entries:
+            self.table.setRowSelectionInterval(0, 0)
+        self.count.setText("%d of %d types" % (len(entries), len(self.search.types)))
+
+    def pick(self):
+        row = self.table.getSelectedRow()
+        if row < 0:
+            return
+        self.dispose()
+        self.choose(self.model.typeAt(row))
+
+
+class FilterTypesTask(Runnable):
+    def __init__(self, dialog, sequence, text):
+        self.dialog = dialog
+        self.sequence = sequence
+        self.text = text
+
+    def run(self):
+        # typed over meanwhile
+        if self.sequence != self.dialog.sequence:
+            return
+
+        if self.text.strip():
+            entries = self.dialog.search.search(self.text).entries
+        else:
+            entries = xrange(len(self.dialog.search.types))
+
+        SwingUtilities.invokeLater(lambda: self.dialog.filtered(self.sequence, entries))
+
+
+class TypeQueryListener(DocumentListener):
+    def __init__(self, dialog):
+        self.dialog = dialog
+
+    def insertUpdate(self, event):
+        self.dialog.refresh()
+
+    def removeUpdate(self, event):
+        self.dialog.refresh()
+
+    def changedUpdate(self, event):
+        self.dialog.refresh()
+
+
+# Enter in the query, the button or a double click on a row.
+class PickTypeListener(MouseAdapter, ActionListener):
+    def __init__(self, dialog):
+        self.dialog = dialog
+
+    def actionPerformed(self, event):
+        self.dialog.pick()
+
+    def mouseClicked(self, event):
+        if event.getClickCount() == 2:
+            self.dialog.pick()
+
+
+class TypePickerClosedListener(WindowAdapter):
+    def __init__(self, dialog):
+        self.dialog = dialog
+
+    def windowClosed(self, event):
+        self.dialog.executor.shutdownNow()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Allocation benchmark of the body pipeline, up to the buffer given to MergeFromString.
+
+Usage: python2 bench/bench_body_copies.py [body size in MB]
+
+Each pipeline runs in its own child process and reports how much its peak
+resident memory grew, in multiples of the body size. The old pipeline
+sliced the body out of the message, converted it to a string and unframed
+it with another slice; the new one copies the message once and passes
+views along.
+"""
+import array
+import os
+import resource
+import struct
+import subprocess
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from byte_view import ByteView
+from decode_cache import body_digest
+from grpc_web import Framing, parse_frames
+
+HEADERS = 'HTTP/1.1 200 OK\r\nContent-Type: application/grpc-web+proto\r\n\r\n'
+
+
+def old_pipeline(content, offset):
+    body = content[offset:]
+    digest = body_digest(content.tostring())
+    raw = body[5:]
+    return memoryview(raw.tostring()), digest
+
+
+def new_pipeline(content, offset):
+    data = ByteView.wrap(content)
+    digest = body_digest(data.buffer())
+    body = data.slice(offset)
+    framing = Framing(body, parse_frames(body))
+    return framing.payloads(None, len(content))[0].memoryview(), digest
+
+
+def peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def child(name, size):
+    # Burp passes the message as a Java byte[], i.e. a signed array in Jython;
+    # built in place so that no temporary copy inflates the baseline
+    prefix = HEADERS + struct.pack('>BI', 0, size)
+    content = array.array('b', 'x') * (len(prefix) + size)
+    content[:len(prefix)] = array.array('b', prefix)
+    before = peak_kb()
+    view, _ = globals()['%s_pipeline' % (name, )](content, len(HEADERS))
+    assert len(view) == size
+    print (peak_kb() - before) * 1024.0 / size
+
+
+def main():
+    if len(sys.argv) > 2:
+        return child(sys.argv[1], int(sys.argv[2]))
+
+    size = int(float(sys.argv[1] if len(sys.argv) > 1 else 64) * 1024 * 1024)
+
+    for name in ('old', 'new'):
+        output = subprocess.check_output([sys.executable, __file__, name, str(size)])
+        print "%s pipeline: peak memory grew by %.2f x body size (%d MB body)" % (
+            name, float(output), size / 1024 / 1024)
+
+
+if __name__ == '__main__':
+    main()
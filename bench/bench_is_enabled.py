@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Micro-benchmark of the isEnabled() checks over a synthetic proxy history.
+
+Usage: python2 bench/bench_is_enabled.py [messages]
+
+Burp's helpers are not available outside Burp, so analyzeRequest is
+emulated by splitting headers and parsing the query string and cookies,
+and indexOf by a case-insensitive find. Both sides use the same emulation,
+and are run with an enabled parameter rule and without any rule.
+"""
+import array
+import os
+import random
+import sys
+import time
+import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from headers import is_protobuf
+from parameter_rules import ParameterRules
+
+PARAM_URL = 0
+PARAM_COOKIE = 2
+
+PARAMETER_TYPES = {'PARAM_URL': PARAM_URL, 'PARAM_COOKIE': PARAM_COOKIE}
+
+
+class Parameter(object):
+    __slots__ = ('type', 'name', 'value')
+
+    def __init__(self, type, name, value):
+        self.type = type
+        self.name = name
+        self.value = value
+
+    def getType(self):
+        return self.type
+
+    def getName(self):
+        return self.name
+
+
+def analyze_request(content):
+    # headers and parameters, as IRequestInfo has them
+    text = content.tostring()
+    head = text.split('\r\n\r\n', 1)[0]
+    headers = head.split('\r\n')
+    query = headers[0].split(' ')[1].partition('?')[2]
+    parameters = [Parameter(PARAM_URL, name, value) for name, value in urlparse.parse_qsl(query)]
+    for header in headers[1:]:
+        name, _, value = header.partition(':')
+        if name.lower() == 'cookie':
+            for cookie in value.split(';'):
+                cookie_name, _, cookie_value = cookie.strip().partition('=')
+                parameters.append(Parameter(PARAM_COOKIE, cookie_name, cookie_value))
+    return headers, parameters
+
+
+class Helpers(object):
+    def indexOf(self, data, pattern, caseSensitive, start, end):
+        data = data.tostring()[:end]
+        pattern = pattern.tostring()
+        if not caseSensitive:
+            data, pattern = data.lower(), pattern.lower()
+        return data.find(pattern, start)
+
+
+CONTENT_TYPES = ['text/html; charset=utf-8', 'application/json',
+                 'application/x-protobuf', 'application/grpc-web+proto',
+                 'image/png', 'application/x-protobuffer; charset=utf-8']
+
+
+def history(count):
+    random.seed(0)
+    messages = []
+    for i in range(count):
+        # some requests carry their message in a parameter
+        data = '&data=CAE%3D' if random.random() < 0.1 else ''
+        headers = ['GET /api/%d?a=1&b=%d%s HTTP/1.1' % (i, i, data), 'Host: example.com',
+                   'User-Agent: bench', 'Accept: */*', 'Cookie: session=%d' % (i, )]
+        headers += ['X-Header-%d: %d' % (n, n) for n in range(10)]
+        headers.append('Content-Type: %s' % (random.choice(CONTENT_TYPES), ))
+        body = 'x' * random.randint(0, 2000)
+        messages.append(array.array('b', '\r\n'.join(headers) + '\r\n\r\n' + body))
+    return messages
+
+
+def old_is_enabled(content, rule_rows):
+    headers, parameters = analyze_request(content)
+
+    for parameter in parameters:
+        # getParameterRules() rebuilt for each parameter
+        rules = {}
+        for ptype, rule_name, when, rule, enabled in rule_rows:
+            if enabled:
+                rules.setdefault(rule_name, {}).setdefault(when.lower(), []).append(rule)
+        if parameter.getName() in rules:
+            return True
+
+    for header in headers[1:]:
+        name, _, value = header.partition(':')
+        if name.lower() == 'content-type':
+            if value.lower().strip() in ('application/protobuf', 'application/x-protobuf',
+                                         'application/x-protobuffer',
+                                         'application/x-protobuffer; charset=utf-8',
+                                         'application/octet-stream',
+                                         'application/grpc-web+proto'):
+                return True
+    return False
+
+
+def new_is_enabled(helpers, content, rules):
+    # the request is analyzed only if there are rules
+    if rules:
+        for parameter in analyze_request(content)[1]:
+            if rules.pipeline(parameter) is not None:
+                return True
+    return is_protobuf(helpers, content)
+
+
+def compile_rules(rule_rows):
+    # as ParameterProcessingRulesTable.compileRules() does, once per table change
+    return ParameterRules((PARAMETER_TYPES[ptype], name, when.lower(), None)
+                          for ptype, name, when, rule, enabled in rule_rows if enabled)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    messages = history(count)
+    helpers = Helpers()
+
+    for title, rule_rows in (('rule on data', [['PARAM_URL', 'data', 'Before', 'base64 decode', True]]),
+                             ('no rule', [])):
+        start = time.time()
+        old = [old_is_enabled(m, rule_rows) for m in messages]
+        old_time = time.time() - start
+
+        start = time.time()
+        rules = compile_rules(rule_rows)
+        new = [new_is_enabled(helpers, m, rules) for m in messages]
+        new_time = time.time() - start
+
+        if old != new:
+            print "%s: results differ!" % (title, )
+
+        print "%-12s %d messages  old %.3f s (%.1f us/msg)  new %.3f s (%.1f us/msg)" % (
+            title, count, old_time, old_time / count * 1e6, new_time, new_time / count * 1e6)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the text shown for big decoded messages.
+
+Usage: python2 bench/bench_message_text.py [entries]
+
+Builds a response with a long repeated field of messages, a map and long
+bytes values, and reports how long the full text format (what the tab used
+to show) and the collapsed rendering take, and how long parsing the
+collapsed text back and restoring what it left out takes.
+"""
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory, text_format
+from google.protobuf.descriptor import FieldDescriptor
+
+from message_text import render, restore
+
+
+def response_class():
+    proto = descriptor_pb2.FileDescriptorProto(name='bench.proto', package='bench', syntax='proto3')
+
+    item = proto.message_type.add(name='Item')
+    item.field.add(name='id', number=1, type=FieldDescriptor.TYPE_INT32, label=FieldDescriptor.LABEL_OPTIONAL)
+    item.field.add(name='name', number=2, type=FieldDescriptor.TYPE_STRING, label=FieldDescriptor.LABEL_OPTIONAL)
+
+    response = proto.message_type.add(name='Response')
+    response.field.add(name='items', number=1, type=FieldDescriptor.TYPE_MESSAGE,
+                       label=FieldDescriptor.LABEL_REPEATED, type_name='.bench.Item')
+    response.field.add(name='data', number=2, type=FieldDescriptor.TYPE_BYTES, label=FieldDescriptor.LABEL_OPTIONAL)
+    entry = response.nested_type.add(name='TagsEntry')
+    entry.options.map_entry = True
+    entry.field.add(name='key', number=1, type=FieldDescriptor.TYPE_STRING, label=FieldDescriptor.LABEL_OPTIONAL)
+    entry.field.add(name='value', number=2, type=FieldDescriptor.TYPE_STRING, label=FieldDescriptor.LABEL_OPTIONAL)
+    response.field.add(name='tags', number=3, type=FieldDescriptor.TYPE_MESSAGE,
+                       label=FieldDescriptor.LABEL_REPEATED, type_name='.bench.Response.TagsEntry')
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(proto)
+    return message_factory.MessageFactory(pool).GetPrototype(pool.FindMessageTypeByName('bench.Response'))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    Response = response_class()
+    response = Response()
+    for i in xrange(count):
+        response.items.add(id=i, name='item %d' % (i, ))
+    for i in xrange(count / 100):
+        response.tags['tag%d' % (i, )] = 'value %d' % (i, )
+    response.data = os.urandom(1024 * 1024)
+    print "message of %d bytes" % (response.ByteSize(), )
+
+    start = time.time()
+    full = str(response)
+    print "full text:      %8.1f ms, %d characters" % ((time.time() - start) * 1000, len(full))
+
+    start = time.time()
+    rendering = render(response, 100, 4096)
+    print "collapsed text: %8.1f ms, %d characters, %d collapsed parts" % (
+        (time.time() - start) * 1000, len(rendering.text), len(rendering.regions))
+
+    start = time.time()
+    edited = Response()
+    text_format.Merge(rendering.text, edited)
+    restore(edited, rendering, rendering.text)
+    print "parse+restore:  %8.1f ms, same message: %s" % ((time.time() - start) * 1000, edited == response)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of proto loading: generated Python modules against descriptor sets.
+
+Usage: python2 bench/bench_proto_loading.py [types] [protoc]
+
+Writes a proto with many message types and loads it the way the extension
+does, each way in its own child process: protoc --python_out, py_compile
+and import of the generated module; or protoc --descriptor_set_out and a
+DescriptorPool. Reports the time taken and how much the peak resident
+memory grew once loaded, and once the message classes of every type are
+built as well (descriptors are only built when a type is first used).
+The generated module can be imported only if protoc is not newer than the
+bundled protobuf runtime.
+"""
+import importlib
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from google.protobuf import message_factory
+
+from descriptor_set import read_descriptor_set
+from message_types import descriptor_types
+
+SCALARS = ['int32', 'int64', 'bool', 'string', 'bytes', 'double', 'fixed32', 'float']
+
+
+def write_proto(directory, count):
+    random.seed(0)
+    lines = ['syntax = "proto3";', 'package bench;']
+
+    for i in range(count):
+        lines.append('message Message%d {' % (i, ))
+        for number in range(1, random.randint(3, 15)):
+            # some fields are other messages of the file
+            if i and random.random() < 0.2:
+                kind = 'Message%d' % (random.randrange(i), )
+            else:
+                kind = random.choice(SCALARS)
+            lines.append('  %s%s f%d = %d;' % ('repeated ' if random.random() < 0.2 else '', kind, number, number))
+        lines.append('}')
+
+    with open(os.path.join(directory, 'bench.proto'), 'w') as f:
+        f.write('\n'.join(lines))
+
+
+def peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def load_modules(protoc, directory):
+    subprocess.check_call([protoc, '-I', directory, '--python_out', directory, 'bench.proto'])
+    subprocess.check_call([sys.executable, '-m', 'py_compile', os.path.join(directory, 'bench_pb2.py')])
+
+    sys.path.append(directory)
+    return descriptor_types(importlib.import_module('bench_pb2').DESCRIPTOR)
+
+
+def load_descriptors(protoc, directory):
+    path = os.path.join(directory, 'bench.pb')
+    subprocess.check_call([protoc, '-I', directory, '--include_imports', '--descriptor_set_out', path,
+                           'bench.proto'])
+
+    with open(path, 'rb') as f:
+        return read_descriptor_set(f.read())['bench.proto']
+
+
+def child(name, protoc, directory):
+    before = peak_kb()
+    start = time.time()
+
+    message_types = globals()['load_%s' % (name, )](protoc, directory)
+    print time.time() - start, (peak_kb() - before) / 1024.0,
+
+    factory = message_factory.MessageFactory()
+    for message_type in message_types.values():
+        factory.GetPrototype(message_type.descriptor)
+
+    print time.time() - start, (peak_kb() - before) / 1024.0
+
+
+def main():
+    if len(sys.argv) > 3:
+        return child(*sys.argv[1:4])
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    protoc = sys.argv[2] if len(sys.argv) > 2 else 'protoc'
+
+    for name in ('modules', 'descriptors'):
+        directory = tempfile.mkdtemp()
+        try:
+            write_proto(directory, count)
+            output = subprocess.check_output([sys.executable, __file__, name, protoc, directory])
+            loaded, loaded_memory, built, built_memory = map(float, output.split())
+            print "%s: %d types loaded in %.2f s (+%.1f MB), with every class built %.2f s (+%.1f MB)" % (
+                name, count, loaded, loaded_memory, built, built_memory)
+        except subprocess.CalledProcessError:
+            print "%s: loading failed" % (name, )
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the in-process raw decoder against `protoc --decode_raw`.
+
+Usage: python2 bench/bench_raw_decoder.py [protoc binary] [iterations]
+
+Also checks that both produce the same text for every sample. protoc is
+faster on big bodies, which is why the extension hands bodies from
+RAW_PROTOC_MIN_SIZE on to it.
+"""
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from google.protobuf import descriptor_pb2
+
+from raw_decoder import decode_raw
+
+
+def protoc_decode_raw(protoc, body):
+    process = subprocess.Popen([protoc, '--decode_raw'],
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    output, error = process.communicate(body)
+    return error or output
+
+
+def samples():
+    # A real-world shaped message: the descriptor of descriptor.proto itself
+    small = descriptor_pb2.DESCRIPTOR.serialized_pb
+
+    # A large response with many repeated nested entries
+    file_set = descriptor_pb2.FileDescriptorSet()
+    for _ in range(50):
+        file_set.file.add().MergeFromString(small)
+    large = file_set.SerializeToString()
+
+    return [('small', small), ('large', large)]
+
+
+def timeit(function, body, iterations):
+    start = time.time()
+    for _ in range(iterations):
+        function(body)
+    return (time.time() - start) / iterations * 1000
+
+
+def main():
+    protoc = sys.argv[1] if len(sys.argv) > 1 else 'protoc'
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    for name, body in samples():
+        if decode_raw(body) != protoc_decode_raw(protoc, body):
+            print "%s: output differs from protoc!" % (name, )
+
+        in_process = timeit(decode_raw, body, iterations)
+        subprocess_ = timeit(lambda b: protoc_decode_raw(protoc, b), body,
+                             iterations)
+
+        print "%-6s %8d bytes  in-process %8.2f ms  protoc %8.2f ms" % (
+            name, len(body), in_process, subprocess_)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the imports paid when the extension starts and on first use.
+
+Usage: python2 bench/bench_startup.py [runs]
+
+Imports, each time in a fresh child process, the modules of Lib that the
+extension imports when Burp loads it, then the ones it imports on the
+first decode and the first loaded proto (the protobuf runtime), and
+reports the median time of each. The modules needing Java or Burp are
+left out. Inside Burp the extension prints its own load time.
+"""
+import os
+import subprocess
+import sys
+
+LIB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Lib')
+
+STARTUP_MODULES = ['byte_view', 'compression', 'decode_cache', 'grpc_web', 'headers', 'proto_cache', 'proto_graph',
+                   'proto_watch']
+
+FIRST_USE_MODULES = ['google.protobuf.message', 'raw_decoder', 'type_index', 'google.protobuf.message_factory',
+                     'google.protobuf.text_format', 'descriptor_set']
+
+CHILD = '''
+import sys, time
+sys.path.append(%r)
+%s
+start = time.time()
+%s
+print time.time() - start, len([name for name in sys.modules if name.startswith('google')])
+'''
+
+
+def import_time(before, modules):
+    code = CHILD % (LIB, '\n'.join('import ' + name for name in before), '\n'.join('import ' + name for name in modules))
+    seconds, google = subprocess.check_output([sys.executable, '-c', code]).split()
+    return float(seconds), int(google)
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 11
+
+    startup = [import_time([], STARTUP_MODULES) for _ in range(runs)]
+    first_use = [import_time(STARTUP_MODULES, FIRST_USE_MODULES) for _ in range(runs)]
+
+    print "startup: %.1f ms (%d protobuf modules)" % (median([t for t, _ in startup]) * 1000, startup[0][1])
+    print "first use: %.1f ms (%d protobuf modules)" % (median([t for t, _ in first_use]) * 1000, first_use[0][1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of automatic type detection with many loaded message types.
+
+Usage: python2 bench/bench_type_index.py [types] [messages]
+
+Builds a proto with random message types, serializes random messages of
+some of them and reports how long detection takes and how often the
+detected type is the one the message was built with. Trying to parse the
+message with every type, as the old strategies did, is timed too.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from google.protobuf import descriptor_pb2
+from google.protobuf import descriptor_pool
+from google.protobuf import message_factory
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.internal import decoder
+
+from message_types import proto_types
+from type_index import TypeIndex
+
+SCALARS = [FieldDescriptor.TYPE_INT32, FieldDescriptor.TYPE_INT64, FieldDescriptor.TYPE_BOOL,
+           FieldDescriptor.TYPE_STRING, FieldDescriptor.TYPE_BYTES, FieldDescriptor.TYPE_DOUBLE,
+           FieldDescriptor.TYPE_FIXED32, FieldDescriptor.TYPE_FLOAT]
+
+
+def build_types(count):
+    random.seed(0)
+    proto = descriptor_pb2.FileDescriptorProto(name='bench.proto', package='bench', syntax='proto3')
+
+    for i in range(count):
+        message = proto.message_type.add(name='Message%d' % (i, ))
+        numbers = random.sample(range(1, 30), random.randint(2, 12))
+        for number in numbers:
+            field = message.field.add(name='f%d' % (number, ), number=number)
+            field.label = random.choice([FieldDescriptor.LABEL_OPTIONAL] * 4 + [FieldDescriptor.LABEL_REPEATED])
+
+            # some fields are other messages of the file
+            if i and random.random() < 0.2:
+                field.type = FieldDescriptor.TYPE_MESSAGE
+                field.type_name = '.bench.Message%d' % (random.randrange(i), )
+            else:
+                field.type = random.choice(SCALARS)
+
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(proto)
+    return proto_types(proto, pool).values()
+
+
+def fill(message, depth=2):
+    for field in message.DESCRIPTOR.fields:
+        if random.random() < 0.3:
+            continue
+        repeated = field.label == FieldDescriptor.LABEL_REPEATED
+        if field.type == FieldDescriptor.TYPE_MESSAGE:
+            if depth:
+                nested = getattr(message, field.name).add() if repeated else getattr(message, field.name)
+                fill(nested, depth - 1)
+                nested.SetInParent()
+            continue
+
+        value = {
+            FieldDescriptor.TYPE_BOOL: True,
+            FieldDescriptor.TYPE_STRING: u'value',
+            FieldDescriptor.TYPE_BYTES: b'\x01\x02',
+            FieldDescriptor.TYPE_DOUBLE: 1.5,
+            FieldDescriptor.TYPE_FLOAT: 2.5,
+        }.get(field.type, random.randint(1, 1000))
+
+        if repeated:
+            getattr(message, field.name).extend([value, value])
+        else:
+            setattr(message, field.name, value)
+
+
+def top_level_fields(body):
+    body = memoryview(body)
+    count = pos = 0
+    while pos < len(body):
+        tag_bytes, pos = decoder.ReadTag(body, pos)
+        pos = decoder.SkipField(body, pos, len(body), tag_bytes)
+        count += 1
+    return count
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    message_types = build_types(count)
+    factory = message_factory.MessageFactory()
+
+    start = time.time()
+    index = TypeIndex(message_types)
+    print "Index of %d types built in %.1f ms" % (len(index), (time.time() - start) * 1000)
+
+    random.seed(1)
+    bodies = []
+    for message_type in random.sample(message_types, samples):
+        message = factory.GetPrototype(message_type.descriptor)()
+        fill(message)
+        bodies.append((message_type, message.SerializeToString()))
+
+    detected = correct = 0
+    start = time.time()
+    for message_type, body in bodies:
+        best, _ = index.detect(memoryview(body))
+        if best is not None:
+            detected += 1
+            correct += best.message_type is message_type
+    elapsed = (time.time() - start) / len(bodies)
+
+    print "Detection: %.3f ms per message, %d/%d detected, %d of them right" % (
+        elapsed * 1000, detected, len(bodies), correct)
+
+    # a message with 100000 top-level fields (concatenated messages are merged): only its first fields are read
+    message_type, body = bodies[0]
+    long_body = body * (100000 / max(1, top_level_fields(body)))
+    start = time.time()
+    index.detect(memoryview(long_body))
+    print "Detection of a %d KB message with 100000 top-level fields: %.3f ms" % (
+        len(long_body) / 1024, (time.time() - start) * 1000)
+
+    # what the disabled strategies of setMessage did: parse with every type
+    classes = [factory.GetPrototype(message_type.descriptor) for message_type in message_types]
+    start = time.time()
+    for _, body in bodies[:10]:
+        for klass in classes:
+            try:
+                klass().ParseFromString(body)
+            except Exception:
+                pass
+    print "Parsing with every type: %.3f ms per message" % ((time.time() - start) / 10 * 1000, )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the type search of the "Filter .proto" menu.
+
+Usage: python2 bench/bench_type_search.py [types]
+
+Builds random message types with nested ones, spread over files, and
+reports how long building the index (done when the protos are loaded)
+and running queries takes, against the regular expression search of
+every name the menu used to run.
+"""
+import os
+import random
+import re
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'Lib'))
+
+from message_types import MessageType
+from type_search import TypeSearch
+
+WORDS = ['user', 'account', 'order', 'payment', 'item', 'request', 'response', 'list', 'get', 'update', 'delete',
+         'create', 'session', 'token', 'profile', 'settings', 'event', 'status', 'error', 'detail']
+
+QUERIES = ['user', 'paymentresponse', 'ur', 'Order.*Request', 'usrprof', 'tokenstatus']
+
+
+def random_type(scope, depth):
+    name = ''.join(word.capitalize() for word in random.sample(WORDS, random.randint(2, 4)))
+    full_name = '%s.%s' % (scope, name)
+    nested = [random_type(full_name, depth + 1) for _ in range(random.randint(0, 3) if depth < 2 else 0)]
+    return MessageType(name, full_name, (), nested, False)
+
+
+def build(count):
+    random.seed(0)
+    descriptors = OrderedDict()
+    total = 0
+    while total < count:
+        package = 'bench.%s' % (random.choice(WORDS), )
+        types = OrderedDict()
+        for _ in range(50):
+            message_type = random_type(package, 0)
+            types[message_type.name] = message_type
+        descriptors['%s%d_pb2' % (package.replace('.', '/'), len(descriptors))] = types
+        total += len(TypeSearch({'': types}).types)
+    return descriptors
+
+
+def regex_search(descriptors, query):
+    found = []
+
+    def walk(types):
+        for name, message_type in types.iteritems():
+            if re.search(query, name, re.IGNORECASE):
+                found.append(message_type)
+            walk(message_type.nested_types_by_name)
+
+    for types in descriptors.itervalues():
+        walk(types)
+    return found
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    descriptors = build(count)
+
+    start = time.time()
+    search = TypeSearch(descriptors)
+    print "%d types listed in %.1f ms" % (len(search.types), (time.time() - start) * 1000)
+
+    start = time.time()
+    search.prepare()
+    print "index built in %.1f ms (on the loading worker)" % ((time.time() - start) * 1000, )
+
+    for query in QUERIES:
+        start = time.time()
+        result = search.search(query)
+        first = time.time() - start
+
+        start = time.time()
+        search.search(query)
+        again = time.time() - start
+
+        start = time.time()
+        regex_search(descriptors, query)
+        regex = time.time() - start
+
+        print "%-16s %6d matches, %7.1f ms (again %.3f ms), regex over every name %7.1f ms, best: %s" % (
+            query, len(result.entries), first * 1000, again * 1000, regex * 1000,
+            result.best(1)[0].full_name if result.entries else '-')
+
+
+if __name__ == '__main__':
+    main()
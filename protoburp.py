@@ -1,4 +1,9 @@
 # -*- coding: utf-8 -*-
+import time
+
+# Extension load time, reported once the extension is registered
+STARTUP_TIME = time.time()
+
 from collections import OrderedDict
 import base64
 import importlib
@@ -10,11 +15,7 @@ import subprocess
 import sys
 import tempfile
 import traceback
-import StringIO
-import re
-import gzip
-import array
-import platform
+import threading
 from urllib import unquote, quote_plus
 
 # Patch dir this file was loaded from into the path
@@ -28,85 +29,91 @@ from burp import IBurpExtender, IMessageEditorTab, IMessageEditorTabFactory, ITa
 # Deprecated, replaced by an implementation based on message_factory
 #from google.protobuf.reflection import ParseMessage as parse_message
 
-from google.protobuf.text_format import Merge as merge_message
-from google.protobuf import message_factory
+# The protobuf runtime (and raw_decoder, type_index, message_types, descriptor_set which build on it) is most of
+# the extension load time: it is imported on first use, by the first decode or the first loaded proto
 
+from java.awt import BorderLayout
 from java.awt.event import ActionListener, MouseAdapter
-from java.lang import Boolean, RuntimeException
-from java.io import FileFilter, File
-from javax.swing import JButton, JFileChooser, JMenu, JMenuItem, JOptionPane, JPanel, JPopupMenu
+from javax.swing.event import MenuListener
+from java.lang import Boolean, Runnable, Runtime, RuntimeException
+from java.util.concurrent import Callable, Executors, TimeUnit
+from java.io import File
+from javax.swing import JButton, JCheckBoxMenuItem, JFileChooser, JMenu, JMenuItem, JOptionPane, JPanel, JPopupMenu, \
+        SwingUtilities
 from javax.swing.filechooser import FileNameExtensionFilter
-from java.lang import System
 
-from ui import ParameterProcessingRulesTable
+from ui import ParameterProcessingRulesTable, ProtoLoadingPanel, LoadingProgress, RoutesTable, ScanPatternsPanel, \
+        TypePickerDialog
 from ui import decode_url_and_base64, encode_base64_and_url
+from decode_cache import DecodeCache, body_digest
+from headers import analyzed_header, is_protobuf
+from compression import Encoding
+from grpc_web import Framing, parse_frames
+from byte_view import ByteView
+from proto_cache import ProtoCache
+from proto_graph import ProtoGraph, ProtoGraphError, file_key, module_name
+from routes import request_path
+from proto_scan import DESCRIPTOR_SET_EXTENSIONS, split_globs, unique_protos, walk_protos
+from proto_watch import ProtoWatcher
+from type_search import TypeSearch
+from protoc import Protoc, ProtocError
+
+PROTO_FILENAME_EXTENSION_FILTER = FileNameExtensionFilter("*.proto, *.py, *.desc, *.pb, *.protoset",
+                                                          ["proto", "py", "desc", "pb", "protoset"])
 
-CONTENT_PROTOBUF = ['application/protobuf', 'application/x-protobuf', 'application/x-protobuffer', 'application/x-protobuffer; charset=utf-8', 'application/octet-stream', 'application/grpc-web+proto']
+PYTHON2_BINARY = 'python2'
 
-PROTO_FILENAME_EXTENSION_FILTER = FileNameExtensionFilter("*.proto, *.py",
-                                                          ["proto", "py"])
-CONTENT_GZIP = ('gzip')
+# Generate Python modules from protos (protoc --python_out and py_compile) instead of loading them as
+# descriptor sets (protoc --descriptor_set_out), which skips code generation and compilation
+LOAD_PROTOS_AS_MODULES = False
 
-PYTHON2_BINARY = 'python2'
+DESCRIPTOR_SET_FILENAME = 'descriptors.pb'
 
-def detectProtocBinaryLocation():
-    system = System.getProperty('os.name')
-    arch = platform.architecture()[0]
-
-    if arch == "32bit":
-        if system == "Linux":
-            os.chmod("./protoc-linux-32", 0755)
-            return os.path.join(os.getcwd(), "protoc-linux-32")
-        elif system.startswith("Mac "):
-            os.chmod("./protoc-mac-32", 0755)
-            return os.path.join(os.getcwd(), "protoc-mac-32")
-        elif system.startswith("Windows "):
-            return os.path.join(os.getcwd(), "protoc-windows.exe")
-        else:
-            raise RuntimeError("Unrecognized operating system: " + system)
-    elif arch == "64bit":
-        if system == "Linux":
-            os.chmod("./protoc-linux-64", 0755)
-            return os.path.join(os.getcwd(), "protoc-linux-64")
-        elif system.startswith("Mac "):
-            os.chmod("./protoc-mac-64", 0755)
-            return os.path.join(os.getcwd(), "protoc-mac-64")
-        elif system.startswith("Windows "):
-            return os.path.join(os.getcwd(), "protoc-windows.exe")
-        else:
-            raise RuntimeError("Unrecognized operating system: " + system)
-    else:
-        raise RuntimeError("Unrecognized operating system architecture: " + arch)
+# Protos compiled by protoc, kept across Burp sessions
+PROTO_CACHE_DIRECTORY = os.path.join(os.path.expanduser('~'), '.protoburp', 'cache')
+
+# Maximum size (in bytes) of a decompressed body, protects Burp from decompression bombs
+DECOMPRESSION_MAX_SIZE = 64 * 1024 * 1024
+
+# Memory ceiling (in bytes) of the cache of decoded messages
+DECODE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Memory of a message parsed by the pure-Python runtime, per byte of the message (about 50 on CPython):
+# messages of more than DECODE_CACHE_MAX_BYTES / MESSAGE_WEIGHT bytes are parsed again rather than cached
+MESSAGE_WEIGHT = 64
+
+# Background threads decoding messages, so that big messages do not freeze Burp UI
+DECODE_WORKERS = 2
+
+# Background threads compiling protos, protoc runs are independent of each other
+LOAD_WORKERS = Runtime.getRuntime().availableProcessors()
+
+# Seconds between two checks of the loaded protos for changes, when watching them
+WATCH_INTERVAL = 2
 
+DECODING_PLACEHOLDER = "Decoding..."
 
-PROTOC_BINARY_LOCATION = detectProtocBinaryLocation()
+# Likely message types offered in the "Suggested" menu
+SUGGESTED_TYPES = 10
 
-def isGzip(content):
-    isGzip = False
-    headers = content.getHeaders()
+# Best matches of the filter offered in the "Matches" menu
+SEARCH_MATCHES = 30
 
-    # first header is the request/response line
-    for header in headers[1:]:
-        name, _, value = header.partition(':')
-        if name.lower() == 'content-encoding':
-            value = value.lower().strip()
-            if value in CONTENT_GZIP:
-                isGzip = True
-    return isGzip
+# Messages from this size (in bytes) are shown with their long repeated fields and values collapsed, which the
+# "Expand collapsed fields" menu shows in full
+COLLAPSE_MIN_SIZE = 256 * 1024
+COLLAPSE_MAX_ENTRIES = 100
+COLLAPSE_MAX_VALUE = 4096
 
-def gUnzip(gzipcontent):
-    buf = StringIO.StringIO(gzipcontent)
-    f = gzip.GzipFile(fileobj=buf)
-    body = f.read()
-    f.close()
-    return body
+# Bodies from this size (in bytes) are decoded without proto by protoc, faster than the in-process decoder on
+# big bodies despite starting a process
+RAW_PROTOC_MIN_SIZE = 64 * 1024
 
-def gZip(tozipcontent):
-    out = StringIO.StringIO()
-    gzip_s = gzip.GzipFile(fileobj=out, mode="w")
-    gzip_s.write(tozipcontent)    
-    gzip_s.close()
-    return out.getvalue()
+# Directory of the extension, where the protoc binaries are
+EXTENSION_DIRECTORY = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe())))
+
+# Found and checked the first time a proto is compiled
+PROTOC = Protoc(EXTENSION_DIRECTORY)
 
 
 class BurpExtender(IBurpExtender, IMessageEditorTabFactory, ITab, IExtensionStateListener):
@@ -115,6 +122,30 @@ class BurpExtender(IBurpExtender, IMessageEditorTabFactory, ITab, IExtensionStat
     def __init__(self):
         self.descriptors = OrderedDict()
 
+        # Message classes shared by every editor tab, keyed by descriptor full name (factory created on first use)
+        self.factory = None
+        self.message_classes = {}
+        self.message_classes_lock = threading.Lock()
+
+        self.decode_cache = DecodeCache(DECODE_CACHE_MAX_BYTES)
+
+        # Field signatures of every loaded message type, for automatic type detection (None until a proto is loaded)
+        self.type_index = None
+
+        # Search index of the loaded type names, built on the first search after a load
+        self.type_search = None
+        self.decode_executor = Executors.newFixedThreadPool(DECODE_WORKERS)
+
+        # Protos loaded by the user (absolute paths), saved on unload and restored at startup
+        self.loaded_protos = OrderedDict()
+
+        # One load at a time, in background
+        self.load_executor = Executors.newSingleThreadExecutor()
+
+        # Loaded protos are reloaded when they (or the protos they import) change, if watching
+        self.watcher = ProtoWatcher()
+        self.watch_executor = None
+
         self.chooser = JFileChooser()
         self.chooser.addChoosableFileFilter(PROTO_FILENAME_EXTENSION_FILTER)
         self.chooser.setFileSelectionMode(JFileChooser.FILES_AND_DIRECTORIES)
@@ -123,25 +154,10 @@ class BurpExtender(IBurpExtender, IMessageEditorTabFactory, ITab, IExtensionStat
     def registerExtenderCallbacks(self, callbacks):
         self.callbacks = callbacks
         self.helpers = callbacks.getHelpers()
-        self.enabled = False
-
-        try:
-            process = subprocess.Popen([PROTOC_BINARY_LOCATION, '--version'],
-                                       stdin=subprocess.PIPE,
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE)
-            output, error = process.communicate()
-            self.enabled = output.startswith('libprotoc')
-
-            if error:
-                raise RuntimeError(error)
 
-        except (OSError, RuntimeError) as error:
-            self.callbacks.getStderr().write(
-                    "Error calling protoc: %s\n" % (error.message, ))
-
-        if not self.enabled:
-            return
+        # raw decoding and descriptor sets do not need protoc, it is only run when a proto is first compiled
+        # (generated code depends on the protoc version too)
+        self.proto_cache = ProtoCache(PROTO_CACHE_DIRECTORY, PROTOC.version)
 
         rules = []
         '''
@@ -159,10 +175,257 @@ class BurpExtender(IBurpExtender, IMessageEditorTabFactory, ITab, IExtensionStat
 
         self.table = ParameterProcessingRulesTable(self, *rules)
 
+        # Message types of endpoints, decoded with them without choosing the type
+        routes = []
+        saved_routes = callbacks.loadExtensionSetting('routes')
+
+        if saved_routes:
+            routes = json.loads(saved_routes)
+
+            # As for the rules, checkboxes need java.lang.Boolean
+            for route in routes:
+                route[-1] = Boolean(route[-1])
+
+        self.routes = RoutesTable(*routes)
+
+        # Suite tab: parameter rules and routes, and the progress of proto loads under them
+        self.loading = ProtoLoadingPanel()
+        rulesPanel = JPanel(BorderLayout(5, 5))
+        rulesPanel.add(self.table, BorderLayout.NORTH)
+        rulesPanel.add(self.routes, BorderLayout.CENTER)
+        self.panel = JPanel(BorderLayout(5, 5))
+        self.panel.add(rulesPanel, BorderLayout.NORTH)
+        self.panel.add(self.loading, BorderLayout.CENTER)
+
+        # Glob patterns of the protos loaded from the selected directories
+        self.scanPatterns = ScanPatternsPanel(callbacks.loadExtensionSetting('include') or '',
+                                              callbacks.loadExtensionSetting('exclude') or '')
+        self.chooser.setAccessory(self.scanPatterns)
+
         callbacks.setExtensionName(self.EXTENSION_NAME)
         callbacks.registerExtensionStateListener(self)
         callbacks.registerMessageEditorTabFactory(self)
         callbacks.addSuiteTab(self)
+
+        # restored in background: the extension is usable at once and the types appear when ready
+        # (protos compiled in an earlier session are found in the proto cache)
+        saved_protos = callbacks.loadExtensionSetting('protos')
+
+        if saved_protos:
+            saved_protos = json.loads(saved_protos)
+
+            # remembered until the restore finds them missing: saved again if Burp closes before the restore
+            # ends, or if they fail to compile in this session
+            for path in saved_protos:
+                self.loaded_protos[path] = True
+
+            self.load_executor.submit(RestoreProtosTask(self, saved_protos,
+                                                        LoadingProgress(self.loading, "Restoring")))
+
+        if callbacks.loadExtensionSetting('watch') == 'true':
+            self.setWatching(True)
+
+        print "Extension loaded in %d ms (imports %d ms)" % ((time.time() - STARTUP_TIME) * 1000,
+                                                             (LOADED_TIME - STARTUP_TIME) * 1000)
+
+        return
+
+    # Called from decode workers too, hence the lock. The descriptor is built here the first time the type is used.
+    def getMessageClass(self, message_type):
+        # the type may have been chosen before its proto was reloaded
+        type_index = self.type_index
+        if type_index is not None:
+            message_type = type_index.types.get(message_type.full_name, message_type)
+
+        with self.message_classes_lock:
+            klass = self.message_classes.get(message_type.full_name)
+
+            if klass is None:
+                if self.factory is None:
+                    from google.protobuf import message_factory
+                    self.factory = message_factory.MessageFactory()
+
+                klass = self.factory.GetPrototype(message_type.descriptor)
+                self.message_classes[message_type.full_name] = klass
+
+            return klass
+
+    # A proto and the protos it depends on are compiled together, dependencies are found from its import statements.
+    # Called from loading workers. Returns (message types by module name, None) or (None, error).
+    def importProtoFile(self, proto, graph=None):
+
+        try:
+            files = load_proto(proto, self.proto_cache, graph)
+            if files is None:
+                return None, '%s: cannot be compiled (see the extension output)' % (proto.getName(), )
+            return files, None
+
+        except (ProtoGraphError, ProtocError) as error:
+            self.callbacks.getStderr().write('*** ERROR, %s\n' % (str(error), ))
+            return None, str(error)
+
+        except (Exception, RuntimeException) as error:
+            self.callbacks.getStderr().write('*** ERROR importing %s: %s!\n' % (proto.getName(), str(error), ))
+            tb = traceback.format_exc()
+            self.callbacks.getStderr().write('Traceback: %s!\n' % (str(tb), ))
+            return None, '%s: %s' % (proto.getName(), error)
+
+    # Protos are compiled in parallel, each with the protos it imports. Protos imported by another one of the
+    # protos are compiled with it. Yields (proto, message types by module name or None) in the order of protos.
+    # progress (a LoadingProgress) is told about every proto and stops the load when cancelled.
+    def importProtoFiles(self, protos, progress=None):
+        path = lambda proto: os.path.abspath(proto.getAbsolutePath())
+
+        graphs = {}
+        parsed = {}
+        for proto in protos:
+            if proto.getName().endswith('.proto'):
+                try:
+                    graphs[path(proto)] = ProtoGraph(path(proto), parsed)
+                except EnvironmentError:
+                    # reported when it is loaded
+                    pass
+
+        imported = set(dependency.path for graph in graphs.itervalues() if graph.valid
+                       for dependency in graph.order if dependency is not graph.main)
+        absorbed = [proto for proto in protos if path(proto) in imported]
+        protos = [proto for proto in protos if path(proto) not in imported]
+
+        # the protos left to each proto importing them, loaded on their own if it fails
+        fallbacks = {}
+        for proto in absorbed:
+            for importer in protos:
+                graph = graphs.get(path(importer))
+                if graph is not None and graph.valid and any(dependency.path == path(proto)
+                                                             for dependency in graph.order):
+                    fallbacks.setdefault(path(importer), []).append(proto)
+                    break
+
+        if progress is not None:
+            progress.start(len(protos))
+
+        if not protos:
+            return
+
+        executor = Executors.newFixedThreadPool(min(LOAD_WORKERS, len(protos)))
+        try:
+            tasks = [(proto, executor.submit(LoadProtoTask(self, proto, graphs.get(path(proto)))))
+                     for proto in protos]
+
+            done = 0
+            while done < len(tasks):
+                proto, future = tasks[done]
+                if progress is not None:
+                    if progress.cancelled:
+                        return
+                    progress.advance(done, len(tasks), proto.getAbsolutePath())
+
+                files, error, elapsed = future.get()
+                self.callbacks.getStdout().write('Loaded %s in %.2f s\n' % (proto.getAbsolutePath(), elapsed))
+
+                if progress is not None and error is not None:
+                    progress.fail(error)
+
+                if files is None:
+                    for dependency in fallbacks.pop(path(proto), ()):
+                        self.callbacks.getStdout().write('Loading %s on its own, %s failed\n' % (
+                            dependency.getAbsolutePath(), proto.getName()))
+                        tasks.append((dependency, executor.submit(
+                            LoadProtoTask(self, dependency, graphs.get(path(dependency))))))
+
+                yield proto, files
+                done += 1
+
+        finally:
+            # protoc runs already started are left to complete, the pending ones are dropped
+            executor.shutdownNow()
+
+    # Called from the loading workers, so that the Swing event thread only swaps what is built here: the
+    # descriptors with the types of a load and the type index. A proto loaded again replaces its types (and
+    # the ones of its imports) in place. Returns (descriptors it was built on, descriptors, type index,
+    # type search).
+    def prepareLoadedProtos(self, loaded):
+        from type_index import TypeIndex
+
+        base = self.descriptors
+        descriptors = OrderedDict(base)
+
+        for proto, files in loaded:
+            if files is None:
+                continue
+
+            for name, types in files.iteritems():
+                if types:
+                    descriptors[name] = dict(types)
+
+        type_index = TypeIndex(descriptor for types in descriptors.itervalues() for descriptor in types.itervalues())
+        type_search = TypeSearch(descriptors).prepare()
+        return base, descriptors, type_index, type_search
+
+    # Always called on the Swing event thread, the menus read the descriptors. The types of a load are
+    # published at once, by swapping the descriptors.
+    def addLoadedProtos(self, loaded, prepared):
+        base, descriptors, type_index, type_search = prepared
+
+        # another load (or a watch reload) was published meanwhile: built again, not to lose its types
+        if base is not self.descriptors:
+            base, descriptors, type_index, type_search = self.prepareLoadedProtos(loaded)
+
+        for proto, files in loaded:
+            if files is None:
+                continue
+
+            path = os.path.abspath(proto.getAbsolutePath())
+            self.loaded_protos[path] = True
+            self.watcher.watch(path)
+
+        # swapped first, so that no class is built again from a stale type
+        self.type_index = type_index
+        self.type_search = type_search
+        self.descriptors = descriptors
+        self.invalidateMessageClasses()
+        return
+
+    # Always called on the Swing event thread: protos that no longer exist are not restored again
+    def forgetProtos(self, paths):
+        for path in paths:
+            self.loaded_protos.pop(path, None)
+        return
+
+    # Called from the menus, on the Swing event thread. Searches of the same descriptors reuse the index and its results,
+    # built with the descriptors on the loading worker.
+    def typeSearch(self):
+        descriptors = self.descriptors
+        if self.type_search is None or self.type_search.descriptors is not descriptors:
+            self.type_search = TypeSearch(descriptors)
+        return self.type_search
+
+    # Loads the selected files and the protos of the selected directories in background, reporting to the
+    # loading panel of the suite tab
+    def loadProtos(self, paths, title, include=None, exclude=None):
+        self.load_executor.submit(ScanProtosTask(self, paths, include, exclude, LoadingProgress(self.loading, title)))
+
+    # Called when protos are (re)loaded, so that classes are rebuilt from the new descriptors
+    def invalidateMessageClasses(self):
+        with self.message_classes_lock:
+            self.factory = None
+            self.message_classes = {}
+
+        self.decode_cache.clear()
+
+    def isWatching(self):
+        return self.watch_executor is not None
+
+    def setWatching(self, enabled):
+        if enabled and self.watch_executor is None:
+            self.watch_executor = Executors.newSingleThreadScheduledExecutor()
+            self.watch_executor.scheduleWithFixedDelay(WatchProtosTask(self), WATCH_INTERVAL, WATCH_INTERVAL,
+                                                       TimeUnit.SECONDS)
+
+        elif not enabled and self.watch_executor is not None:
+            self.watch_executor.shutdownNow()
+            self.watch_executor = None
+
         return
 
     def createNewInstance(self, controller, editable):
@@ -172,9 +435,22 @@ class BurpExtender(IBurpExtender, IMessageEditorTabFactory, ITab, IExtensionStat
         return self.EXTENSION_NAME
 
     def getUiComponent(self):
-        return self.table
+        return self.panel
 
     def extensionUnloaded(self):
+        self.decode_executor.shutdownNow()
+        self.load_executor.shutdownNow()
+        self.callbacks.saveExtensionSetting('watch', 'true' if self.isWatching() else 'false')
+        self.setWatching(False)
+        print "Decode cache: %s" % (self.decode_cache.stats(), )
+        print "Proto cache: %s" % (self.proto_cache.stats(), )
+
+        self.callbacks.saveExtensionSetting('protos', json.dumps(self.loaded_protos.keys()))
+        self.callbacks.saveExtensionSetting('include', self.scanPatterns.include.getText())
+        self.callbacks.saveExtensionSetting('exclude', self.scanPatterns.exclude.getText())
+        self.callbacks.saveExtensionSetting('routes', json.dumps(
+            [route[:-1] + [bool(route[-1])] for route in self.routes.routes]))
+
         if not self.table.rules:
             return
 
@@ -203,22 +479,45 @@ class ProtobufEditorTab(IMessageEditorTab):
         self.controller = controller
         self.editable = editable
 
-        self.descriptors = extender.descriptors
         self.chooser = extender.chooser
 
         self.listener = LoadProtoActionListener(self)
 
-        self._current = (None, None, None, None)
+        # content, message (None if it can't be edited), info, parameter, body encoding, gRPC-web framing
+        self._current = (None, None, None, None, None, None)
+
+        # Likely types of the current message, best first (None until the menu needs them), and the body they
+        # are ranked on
+        self.candidates = []
+        self._suggestFrom = None
 
         self.editor = extender.callbacks.createTextEditor()
         self.editor.setEditable(editable)
 
         self.filter_search = None
 
+        # Submenus of the loaded files, kept across popups until a load or the filter changes them
+        self.type_menus = None
+        self.type_menus_key = (None, None)
+
         mouseListener = LoadProtoMenuMouseListener(self)
         self.getUiComponent().addMouseListener(mouseListener)
 
         self.last_proto = None
+        self._isRequest = True
+
+        # Rendering of every body of the message shown (None where nothing is collapsed), and its descriptor
+        self._renderings = []
+        self._descriptor = None
+
+        # Sequence number of the last decode requested, older results are discarded
+        self._sequence = 0
+        self._pending = None
+
+    # Swapped by the extender when protos are loaded
+    @property
+    def descriptors(self):
+        return self.extender.descriptors
 
     def getTabCaption(self):
         return self.TAB_CAPTION
@@ -227,46 +526,38 @@ class ProtobufEditorTab(IMessageEditorTab):
         return self.editor.getComponent()
 
     def isEnabled(self, content, isRequest):
-        if not self.extender.enabled:
-            return False
+        # Necessary sometimes when content-type is not set
+        #return True 
 
         if isRequest:
 
-            # Necessary sometimes when content-type is not set
-            #return True 
-
-            info = self.helpers.analyzeRequest(content)
-
             # check if request contains a specific parameter
+            # (the full request analysis is needed only if there are parameter rules)
 
-            for parameter in info.getParameters():
-                if parameter.getName() in self.extender.table.getParameterRules():
-                    return True
-
-            headers = info.getHeaders()
-            
-        else:
-
-            # Necessary sometimes when content-type is not set
-            #return True 
-
-            headers = self.helpers.analyzeResponse(content).getHeaders()
+            rules = self.extender.table.getParameterRules()
 
-        # first header is the request/response line
+            if rules:
+                for parameter in self.helpers.analyzeRequest(content).getParameters():
+                    if rules.pipeline(parameter) is not None:
+                        return True
 
-        for header in headers[1:]:
-            name, _, value = header.partition(':')
-            if name.lower() == 'content-type':
-                value = value.lower().strip()
-                if value in CONTENT_PROTOBUF:
-                    return True
-        return False
+        return is_protobuf(self.helpers, content)
 
     #whenever string is loaded to grpc-web-proto editor tab
     def setMessage(self, content, isRequest):
         if content is None:
+            # a decode still running for the previous message must not show it again
+            self._sequence += 1
+            if self._pending is not None:
+                self._pending.cancel(True)
+                self._pending = None
+
             self.editor.setText(None)
             self.editor.setEditable(False)
+            self._current = (None, None, None, None, None, None)
+            self.candidates = []
+            self._suggestFrom = None
+            self._renderings = []
             return
 
         if isRequest:
@@ -274,73 +565,19 @@ class ProtobufEditorTab(IMessageEditorTab):
         else:
             info = self.helpers.analyzeResponse(content)
 
-        # by default, let's assume the entire body is a protobuf message
-
-        # check if body is compressed (gzip)
-        # gunzip the content first if required
-
-        if isGzip(info):
-
-            if isRequest:
-                print "Request body is using gzip: Uncompressing..."            
-            else:
-                print "Response body is using gzip: Uncompressing..."            
-
-            body = array.array('B', gUnzip(content[info.getBodyOffset():].tostring()))
-
-        else:
-
-            body = content[info.getBodyOffset():]
-
-        # process parameters via rules defined in Protobuf Decoder ui tab
-
-        parameter = None
-
-        for name, rules in self.extender.table.getParameterRules().iteritems():
-            parameter = self.helpers.getRequestParameter(content, name)
-
-            if parameter is not None:
-
-                # no longer use the entire message body as the protobuf
-                # message, just the value of the parameter according
-                # to our ui defined rules
-
-                body = parameter.getValue().encode('utf-8')
-
-                for rule in rules.get('before', []):
-                    body = rule(body)
-                                        
-                break
-
-        if parameter is None:
-
-            rawBytes = body
-
-            global oldPadding
-            global hasPadding 
-            hasPadding = False
-
-            oldPadding= rawBytes[0:4]
-            if rawBytes[0] == 0 and rawBytes[1] == 0 and rawBytes[2] == 0 and rawBytes[3] == 0:
-                rawBytes = rawBytes[5:rawBytes[4]+5]
-                hasPadding = True
-            body = rawBytes.tostring()
-
+        parameter = self.findParameter(info, isRequest)
+        self._isRequest = isRequest
 
         # If we already selected a proto for this specific tab, continue to use that very proto
 
         if(self.last_proto is not None):
+            self.showDecoded(content, info, parameter, self.last_proto)
+            return
 
-            factory = message_factory.MessageFactory()
-            klass = factory.GetPrototype(self.last_proto)
-            klass_instance = klass()
-            klass_instance.ParseFromString(body)
-
-            message = klass_instance
-
-            self.editor.setText(str(klass_instance))
-            self.editor.setEditable(True)
-            self._current = (content, message, info, parameter)
+        # Otherwise the type routed to the endpoint, if any
+        descriptor = self.routedType(info, isRequest)
+        if descriptor is not None:
+            self.showDecoded(content, info, parameter, descriptor)
             return
         
         # 1 - Loop through all proto descriptors loaded and use the first that matches
@@ -371,7 +608,7 @@ class ProtobufEditorTab(IMessageEditorTab):
                     else:
                         self.editor.setText(str(message))
                         self.editor.setEditable(True)
-                        self._current = (content, message, info, parameter)
+                        self._current = (content, message, info, parameter, None, None)
                         return
         '''
 
@@ -411,61 +648,338 @@ class ProtobufEditorTab(IMessageEditorTab):
         if(content_pane != ""):
             self.editor.setText(str(content_pane))
             self.editor.setEditable(False)
-            self._current = (content, content_pane, info, parameter)
+            self._current = (content, content_pane, info, parameter, None, None)
             return
         '''
 
-        # 3 - This implementation (the one that I prefer) decodes without protos with protoc if no proto is selected
-        process = subprocess.Popen([PROTOC_BINARY_LOCATION, '--decode_raw'],
-                                   stdin=subprocess.PIPE,
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE)
+        # 3 - This implementation (the one that I prefer) decodes with the type detected from the fields
+        # of the message, or without protos if none fits (in-process, same output as protoc --decode_raw)
+        self.showDecoded(content, info, parameter, "auto")
+        return
+
+    # (host, method, path) of the message, taken from the request of the controller for responses; None if unknown
+    def endpoint(self, info, isRequest):
+        if not isRequest:
+            request = self.controller.getRequest() if self.controller is not None else None
+            if request is None:
+                return None
+            info = self.helpers.analyzeRequest(request)
+
+        headers = info.getHeaders()
+        requestLine = headers[0].split(' ')
+        path = requestLine[1] if len(requestLine) > 1 else ''
+
+        service = self.controller.getHttpService() if self.controller is not None else None
+        if service is not None:
+            host = service.getHost()
+        else:
+            host = (analyzed_header(headers, 'Host') or '').rsplit(':', 1)[0]
+
+        return host, info.getMethod(), path
+
+    # The loaded type routed to the endpoint of the message, None if there is none
+    def routedType(self, info, isRequest):
+        router = self.extender.routes.getRouter()
+        type_index = self.extender.type_index
+        if not router or type_index is None:
+            return None
+
+        endpoint = self.endpoint(info, isRequest)
+        if endpoint is None:
+            return None
+
+        host, method, path = endpoint
+        name = router.match(host, method, path, isRequest)
+        return type_index.types.get(name) if name is not None else None
+
+    # Process parameters via rules defined in Protobuf Decoder ui tab
+    def findParameter(self, info, isRequest):
+        rules = self.extender.table.getParameterRules()
+
+        if not isRequest or not rules:
+            return None
+
+        return rules.find(info.getParameters())
+
+    # Returns the protobuf payloads (as ByteViews), the decoded Content-Encoding and the gRPC-web framing
+    # (None if the body is not framed): the parameter processed by rules, the body or the messages of each gRPC-web
+    # frame
+    def extractBody(self, data, info, parameter, rules):
+
+        if parameter is not None:
+
+            # no longer use the entire message body as the protobuf
+            # message, just the value of the parameter according
+            # to our ui defined rules
+
+            pipeline = rules.pipeline(parameter)
+            body = parameter.getValue().encode('utf-8')
+
+            if pipeline is not None:
+                body = pipeline.decode(body)
+
+            return [ByteView(body)], None, None
+
+        # by default, let's assume the entire body is a protobuf message
+
+        # check if body is compressed (Content-Encoding)
+        # decompress the content first if required
+
+        headers = info.getHeaders()
+        body = data.slice(info.getBodyOffset())
+        encoding = Encoding.parse(analyzed_header(headers, 'Content-Encoding'))
+
+        if not encoding.identity:
+            print "Body is compressed: Uncompressing..."
+        body, encoding = encoding.decode(body, DECOMPRESSION_MAX_SIZE)
+
+        # gRPC-web: data frames, followed by trailers
+        frames = parse_frames(body)
+        if frames is None:
+            return [body], encoding, None
+
+        framing = Framing(body, frames)
+
+        # compressed frames use grpc-encoding, gzip if it's missing
+        grpcEncoding = None
+        if any(frame.compressed for frame in frames):
+            grpcEncoding = Encoding.parse(analyzed_header(headers, 'grpc-encoding') or 'gzip')
+
+        return framing.payloads(grpcEncoding, DECOMPRESSION_MAX_SIZE), encoding, framing
+
+    # Results are cached by body digest, message type, rendering and parameter rules, so coming back to a message
+    # does not decode it again. The rules are compared by identity: the table replaces them as a whole when edited,
+    # so results decoded with the old rules are no longer found, even those stored after the edit.
+    def decodeKey(self, data, descriptor, expand, rules):
+        name = descriptor if descriptor in ("raw", "auto") else descriptor.full_name
+        return (body_digest(data.buffer()), name, expand, rules)
+
+    # Decodes the message with a descriptor ("raw" to decode without any proto, "auto" to use the detected type),
+    # returning (text, message, encoding, framing, candidates, renderings, first body).
+    # Candidates are only ranked to detect the type, None otherwise.
+    # expand: render big messages in full instead of collapsing their biggest parts
+    # rules: the parameter rules of the key
+    def decode(self, data, info, parameter, rules, descriptor, key, expand=False):
+        bodies, encoding, framing = self.extractBody(data, info, parameter, rules)
+
+        # ranked on the first message only, the types of the following ones are the same
+        candidates = None
+        best = None
+        type_index = self.extender.type_index
+        if descriptor == "auto" and bodies and type_index is not None:
+            best, candidates = type_index.detect(bodies[0].memoryview(), SUGGESTED_TYPES)
+            candidates = [candidate.message_type for candidate in candidates]
+
+        if descriptor == "auto" and best is not None:
+            print "Parsing message with proto descriptor %s (auto)." % (best.message_type.full_name)
+
+            try:
+                texts, message, renderings = self.decodeBodies(bodies, best.message_type, expand)
+            except Exception:
+                # not that type after all (invalid nested message, string that is not UTF-8...)
+                print "(exception parsing message... - decoding without any proto)"
+                texts, message, renderings = self.decodeBodies(bodies, "raw")
+
+        elif descriptor == "auto":
+            texts, message, renderings = self.decodeBodies(bodies, "raw")
+
+        else:
+            texts, message, renderings = self.decodeBodies(bodies, descriptor, expand)
+
+        text = framing.render(texts) if framing is not None else texts[0]
+
+        # the first body is kept to rank the suggested types when the menu needs them
+        body = bodies[0] if bodies else None
+        result = (text, message, encoding, framing, candidates, renderings, body)
+
+        # the parsed messages (kept by the renderings too) weigh much more than their bytes
+        weight = len(data) + len(text)
+        if message is not None:
+            weight += MESSAGE_WEIGHT * sum(len(body) for body in bodies)
+        if body is not None and body.data is not data.data:
+            # decompressed
+            weight += len(body.data)
+
+        self.extender.decode_cache.put(key, result, weight)
+        return result
+
+    # Text of a body decoded without proto, as protoc --decode_raw prints it
+    def decodeRaw(self, body):
+        from google.protobuf.message import DecodeError
+        from raw_decoder import decode_raw, PARSE_ERROR
+
+        # reported once if protoc does not work, the in-process decoder is used from then on
+        if len(body) >= RAW_PROTOC_MIN_SIZE and not PROTOC.failed():
+            try:
+                return PROTOC.decode_raw(body.tobytes())
+            except ProtocError as error:
+                self.callbacks.getStderr().write('*** ERROR, %s\n' % (str(error), ))
 
-        output = error = None
         try:
-            output, error = process.communicate(body)
-        except OSError:
-            pass
-        finally:
-            if process.poll() != 0:
-                process.wait()
+            return decode_raw(body.memoryview())
+        except DecodeError:
+            return PARSE_ERROR
+
+    # Returns the text of every body, the last message (None if decoded raw) and, for every body, the Rendering
+    # that collapsed parts of it (None if it is rendered in full)
+    def decodeBodies(self, bodies, descriptor, expand=False):
+        from message_text import render
+
+        texts = []
+        message = None
+        renderings = []
+
+        for body in bodies:
+            rendering = None
+
+            if descriptor == "raw":
+                texts.append(self.decodeRaw(body))
+            else:
+                message = self.extender.getMessageClass(descriptor)()
+                message.ParseFromString(body.memoryview())
+
+                if expand or len(body) < COLLAPSE_MIN_SIZE:
+                    texts.append(str(message))
+                else:
+                    rendering = render(message, COLLAPSE_MAX_ENTRIES, COLLAPSE_MAX_VALUE)
+                    texts.append(rendering.text)
+                    if not rendering.regions:
+                        rendering = None
+
+            renderings.append(rendering)
+
+        return texts, message, renderings
+
+    # Shows the decoded message. Cache misses are decoded by a background worker while a placeholder is shown;
+    # a newer request cancels the pending one and stale results are discarded.
+    # byUser: the type was chosen from the menu, remember it and report errors with a dialog
+    # expand: show collapsed parts of big messages
+    def showDecoded(self, content, info, parameter, descriptor, byUser=False, expand=False):
+        self._sequence += 1
+        sequence = self._sequence
+
+        if self._pending is not None:
+            self._pending.cancel(True)
+            self._pending = None
+
+        # the only copy of the Java byte array, everything else is a view on it
+        data = ByteView.wrap(content)
 
-        if error:
-            #print "protoc displaying message - error..."
-            self.editor.setText(error)
+        # the rules of the key are the ones the body is extracted with
+        rules = self.extender.table.getParameterRules()
+        key = self.decodeKey(data, descriptor, expand, rules)
+        cached = self.extender.decode_cache.get(key)
+
+        if cached is not None:
+            self.applyDecoded(sequence, content, info, parameter, descriptor, byUser, cached)
+            return
+
+        self.editor.setText(DECODING_PLACEHOLDER)
+        self.editor.setEditable(False)
+        self._current = (content, None, info, parameter, None, None)
+
+        self._pending = self.extender.decode_executor.submit(
+            DecodeTask(self, sequence, content, data, info, parameter, rules, descriptor, byUser, key, expand))
+        return
+
+    # Always called on the Swing event thread
+    def applyDecoded(self, sequence, content, info, parameter, descriptor, byUser, result):
+        if sequence != self._sequence:
+            return
+
+        self._pending = None
+        text, message, encoding, framing, candidates, renderings, body = result
+
+        self.editor.setText(text)
+        self.editor.setEditable(message is not None)
+        self._current = (content, message, info, parameter, encoding, framing)
+        self.candidates = candidates
+        self._suggestFrom = body
+
+        # what is needed to put collapsed parts back in edited messages, or to expand them
+        self._renderings = renderings
+        self._descriptor = descriptor
+
+        if byUser and descriptor != "raw":
+            self.last_proto = descriptor
+
+        return
+
+    # Always called on the Swing event thread
+    def decodeFailed(self, sequence, descriptor, byUser, error, tb):
+        if sequence != self._sequence:
+            return
+
+        self._pending = None
+
+        if descriptor == "auto":
+            title = "Error parsing message"
+        elif descriptor != "raw":
+            title = "Error parsing message as %s!" % (descriptor.name, )
         else:
-            #print "protoc displaying message - output..."
-            self.editor.setText(output)
+            title = "Error parsing message as without any proto"
 
+        # replaces the placeholder, the message is left as it is
+        self.editor.setText("%s\n%s" % (title, error))
         self.editor.setEditable(False)
-        self._current = (content, None, info, parameter)
+
+        if byUser:
+            JOptionPane.showMessageDialog(self.getUiComponent(),
+                str(error) + tb, title, JOptionPane.ERROR_MESSAGE)
+        else:
+            self.callbacks.getStderr().write('%s\n%s' % (title, tb))
+
         return
 
+    # Called from the menus: the types are ranked the first time they are needed when the message was decoded with
+    # a known type
+    def suggestedTypes(self):
+        if self.candidates is None:
+            candidates = []
+            type_index = self.extender.type_index
+            if self._suggestFrom is not None and type_index is not None:
+                candidates = type_index.rank(self._suggestFrom.memoryview(), SUGGESTED_TYPES)
+            self.candidates = [candidate.message_type for candidate in candidates]
+
+        return self.candidates
+
     def getMessage(self):
-        content, message, info, parameter = self._current
+        from google.protobuf.text_format import Merge as merge_message
+        from message_text import restore
+
+        content, message, info, parameter, encoding, framing = self._current
 
         if message is not None and self.isModified():
 
-            # store original so we can revert if needed
+            try:
+                text = self.editor.getText().tostring()
+                texts = framing.split(text) if framing is not None else [text]
 
-            original = message.SerializeToString()
-            message.Clear()
+                # edit new instances: the decoded message is shared with the decode cache
 
-            try:
-                merge_message(self.editor.getText().tostring(), message) 
+                # frames added in the editor have nothing collapsed
+                renderings = self._renderings + [None] * (len(texts) - len(self._renderings))
+
+                payloads = []
+                for text, rendering in zip(texts, renderings):
+                    edited = message.__class__()
+                    merge_message(text, edited)
+                    if rendering is not None:
+                        restore(edited, rendering, text)
+                    payloads.append(edited.SerializeToString())
 
                 headers = info.getHeaders()
-                serialized = message.SerializeToString()
-               
-                if parameter is None and hasPadding:
-                    oldPadding.append(len(serialized))
-                    serialized = oldPadding.tostring() + serialized
+
+                if framing is not None:
+                    serialized = framing.build(payloads)
+                else:
+                    serialized = payloads[0]
                 
                 if parameter is not None:
-                    rules = self.extender.table.getParameterRules().get(parameter.getName(), {})
+                    pipeline = self.extender.table.getParameterRules().pipeline(parameter)
 
-                    for rule in rules.get('after', []):
-                        serialized = rule(serialized)                                                                
+                    if pipeline is not None:
+                        serialized = pipeline.encode(serialized)
 
                     param = self.helpers.buildParameter(
                             parameter.getName(), serialized, parameter.getType())
@@ -473,10 +987,10 @@ class ProtobufEditorTab(IMessageEditorTab):
                     return self.helpers.updateParameter(content, param)
                 else:
 
-                    if(isGzip(info)):
-                        
-                        print("Recompressing gzip...")
-                        serialized = gZip(serialized)
+                    if not encoding.identity:
+
+                        print("Recompressing body...")
+                        serialized = encoding.encode(serialized)
 
                     return self.helpers.buildHttpMessage(headers, serialized)
 
@@ -485,12 +999,6 @@ class ProtobufEditorTab(IMessageEditorTab):
                     error.message + str(traceback.format_exc()), 'Error parsing message!',
                     JOptionPane.ERROR_MESSAGE)
 
-                # an error occurred while re-serializing the message,
-                # revert back to the original
-
-                message.Clear()
-                message.MergeFromString(original)
-
         return content
 
     def isModified(self):
@@ -500,6 +1008,39 @@ class ProtobufEditorTab(IMessageEditorTab):
         return self.editor.getSelectedText()
 
 
+class DecodeTask(Runnable):
+    def __init__(self, tab, sequence, content, data, info, parameter, rules, descriptor, byUser, key, expand):
+        self.tab = tab
+        self.sequence = sequence
+        self.content = content
+        self.data = data
+        self.info = info
+        self.parameter = parameter
+        self.rules = rules
+        self.descriptor = descriptor
+        self.byUser = byUser
+        self.key = key
+        self.expand = expand
+
+    def run(self):
+        # superseded by a newer message before the worker got to it
+        if self.sequence != self.tab._sequence:
+            return
+
+        try:
+            result = self.tab.decode(self.data, self.info, self.parameter, self.rules, self.descriptor, self.key,
+                                     self.expand)
+        except (Exception, RuntimeException) as error:
+            tb = traceback.format_exc()
+            SwingUtilities.invokeLater(lambda: self.tab.decodeFailed(
+                self.sequence, self.descriptor, self.byUser, error, tb))
+            return
+
+        SwingUtilities.invokeLater(lambda: self.tab.applyDecoded(
+            self.sequence, self.content, self.info, self.parameter, self.descriptor, self.byUser, result))
+        return
+
+
 class LoadProtoMenuMouseListener(MouseAdapter):
     def __init__(self, tab):
         self.tab = tab
@@ -510,23 +1051,17 @@ class LoadProtoMenuMouseListener(MouseAdapter):
     def mouseReleased(self, event):
         return self.handleMouseEvent(event)
 
-    # Recursive method necessary to add also subtimes (a message can have inside other message definitions...)
-    def populate_menu_recursive(self, descriptors, fatherMenu, father_match):
-
-        iter_found = False
-
-        single_father_match = father_match
-        total_father_match = father_match
-
-        # if self.tab.filter_search is None:
+    # Adds the types of descriptors to fatherMenu. The menus of the messages that have inside other message
+    # definitions are filled when they are first opened.
+    # visible: the types left by the filter, None if there is no filter
+    def populate_menu(self, descriptors, fatherMenu, visible):
 
         for name, descriptor in descriptors.iteritems():
 
-            current_nested_dict = descriptor.nested_types_by_name
+            if visible is not None and descriptor not in visible:
+                continue
 
-            if self.tab.filter_search is not None:
-                single_father_match = father_match or re.search(self.tab.filter_search, name, re.IGNORECASE)
-                total_father_match = total_father_match or re.search(self.tab.filter_search, name, re.IGNORECASE)
+            current_nested_dict = descriptor.nested_types_by_name
 
             if(len(current_nested_dict) > 0):
 
@@ -536,23 +1071,59 @@ class LoadProtoMenuMouseListener(MouseAdapter):
                 enclosureOBject = JMenuItem("* Father")
                 enclosureOBject.addActionListener(DeserializeProtoActionListener(self.tab, descriptor))
                 protoMenu.add(enclosureOBject)
-                
-                if self.populate_menu_recursive(current_nested_dict, protoMenu, single_father_match) or self.tab.filter_search is None:
-                    fatherMenu.add(protoMenu)
-                    iter_found = True
+
+                protoMenu.addMenuListener(LazyMenuListener(
+                    lambda menu, nested=current_nested_dict: self.populate_menu(nested, menu, visible)))
 
             else:
 
-                if self.tab.filter_search is None or re.search(self.tab.filter_search, name, re.IGNORECASE) or single_father_match:
+                protoMenu = JMenuItem(name)
+                protoMenu.addActionListener(DeserializeProtoActionListener(self.tab, descriptor))
+
+            fatherMenu.add(protoMenu)
+
+        return
+
+    # The "Matches" menu and a menu per loaded file, built again only when the descriptors or the filter change
+    def typeMenus(self):
+        descriptors = self.tab.descriptors
+        filter_search = self.tab.filter_search
+        cached_descriptors, cached_filter = self.tab.type_menus_key
+
+        if self.tab.type_menus is not None and cached_descriptors is descriptors and cached_filter == filter_search:
+            return self.tab.type_menus
+
+        menus = []
+
+        # Types matching the filter, best first
+        visible = None
+        if filter_search is not None:
+            result = self.tab.extender.typeSearch().search(filter_search)
+            visible = result.visible
+
+            matches = result.best(SEARCH_MATCHES)
+            if matches:
+                matchesMenu = JMenu("Matches")
+                menus.append(matchesMenu)
 
-                    protoMenu = JMenuItem(name)
-                    protoMenu.addActionListener(DeserializeProtoActionListener(self.tab, descriptor))
-                    fatherMenu.add(protoMenu)
+                for descriptor in matches:
+                    matchItem = JMenuItem(descriptor.full_name)
+                    matchItem.addActionListener(DeserializeProtoActionListener(self.tab, descriptor))
+                    matchesMenu.add(matchItem)
 
-                    iter_found = True
+        for pb2, types in descriptors.iteritems():
 
-        return iter_found or total_father_match
+            if visible is not None and not any(descriptor in visible for descriptor in types.itervalues()):
+                continue
 
+            subMenu = JMenu(pb2)
+            subMenu.addMenuListener(LazyMenuListener(
+                lambda menu, types=types: self.populate_menu(types, menu, visible)))
+            menus.append(subMenu)
+
+        self.tab.type_menus = menus
+        self.tab.type_menus_key = (descriptors, filter_search)
+        return menus
 
     def handleMouseEvent(self, event):
         if event.isPopupTrigger():
@@ -566,105 +1137,220 @@ class LoadProtoMenuMouseListener(MouseAdapter):
             filterMenu.addActionListener(SearchProtoActionListener(self.tab, event.getComponent()))
             popup.add(filterMenu)            
 
+            # Reload loaded protos when their files change
+            watchMenu = JCheckBoxMenuItem("Watch loaded .proto", self.tab.extender.isWatching())
+            watchMenu.addActionListener(WatchProtoActionListener(self.tab.extender))
+            popup.add(watchMenu)
+
             if self.tab.descriptors:
 
                 deserializeAsMenu = JMenu("Deserialize As...")
+                deserializeAsMenu.addMenuListener(LazyMenuListener(self.populate_deserialize_menu))
 
                 popup.addSeparator()
                 popup.add(deserializeAsMenu)
 
-                # Raw deserialize using protoc without proto (it cannot be serialized if modified)
-                rawMenu = JMenuItem("Raw")
-                deserializeAsMenu.add(rawMenu)
-                rawMenu.addActionListener(DeserializeProtoActionListener(self.tab, "raw"))
-          
-                for pb2, descriptors in self.tab.descriptors.iteritems(): 
-                    
-                    subMenu = JMenu(pb2)
-
-                    if self.populate_menu_recursive(descriptors, subMenu, self.tab.filter_search is None):
-                        deserializeAsMenu.add(subMenu)
+                # Decode the messages of this endpoint with the chosen type from now on, in every tab
+                if self.tab.last_proto is not None and self.tab._current[2] is not None:
+                    endpoint = self.tab.endpoint(self.tab._current[2], self.tab._isRequest)
+
+                    if endpoint is not None:
+                        host, method, path = endpoint
+                        routeMenu = JMenuItem("Always decode %s %s as %s" % (
+                            method, request_path(path), self.tab.last_proto.full_name))
+                        routeMenu.addActionListener(AddRouteActionListener(
+                            self.tab.extender, host, method, request_path(path),
+                            'Request' if self.tab._isRequest else 'Response', self.tab.last_proto.full_name))
+                        popup.add(routeMenu)
+
+                # Big message shown with parts collapsed
+                if any(rendering is not None for rendering in self.tab._renderings):
+                    expandMenu = JMenuItem("Expand collapsed fields")
+                    expandMenu.addActionListener(ExpandMessageActionListener(self.tab))
+                    popup.add(expandMenu)
+
+                # Searchable list of every type, for APIs with too many types for menus
+                pickTypeMenu = JMenuItem("Deserialize As (search)...")
+                pickTypeMenu.addActionListener(PickTypeActionListener(self.tab, event.getComponent()))
+                popup.add(pickTypeMenu)
 
             popup.show(event.getComponent(), event.getX(), event.getY())
 
         return
 
+    def populate_deserialize_menu(self, deserializeAsMenu):
+        # Raw deserialize without proto, same output as protoc --decode_raw (it cannot be serialized if modified)
+        rawMenu = JMenuItem("Raw")
+        deserializeAsMenu.add(rawMenu)
+        rawMenu.addActionListener(DeserializeProtoActionListener(self.tab, "raw"))
 
-class ListProtoFileFilter(FileFilter):
-    def accept(self, f):
-        basename, ext = os.path.splitext(f.getName())
-        if ext == '.proto' or (ext == '.py' and basename.endswith('_pb2')):
-            return True
-        else:
-            return False
+        # Types whose fields match the ones of the message, best first
+        candidates = self.tab.suggestedTypes()
+        if candidates:
+            suggestedMenu = JMenu("Suggested")
+            deserializeAsMenu.add(suggestedMenu)
+
+            for descriptor in candidates:
+                suggestedItem = JMenuItem(descriptor.full_name)
+                suggestedItem.addActionListener(DeserializeProtoActionListener(self.tab, descriptor))
+                suggestedMenu.add(suggestedItem)
+
+        for typeMenu in self.typeMenus():
+            deserializeAsMenu.add(typeMenu)
+
+        return
+
+
+# Fills a menu the first time it is opened
+class LazyMenuListener(MenuListener):
+    def __init__(self, fill):
+        self.fill = fill
+
+    def menuSelected(self, event):
+        if self.fill is not None:
+            fill, self.fill = self.fill, None
+            fill(event.getSource())
+        return
+
+    def menuDeselected(self, event):
+        return
+
+    def menuCanceled(self, event):
+        return
 
 
 class LoadProtoActionListener(ActionListener):
     def __init__(self, tab):
         self.chooser = tab.chooser
-        self.descriptors = tab.descriptors
         self.tab = tab
 
-    def updateDescriptors(self, name, module):
-        if module.DESCRIPTOR.message_types_by_name and name not in self.descriptors:
-            descriptors = self.descriptors.setdefault(name, {})
-            descriptors.update(module.DESCRIPTOR.message_types_by_name)
+    def actionPerformed(self, event):
+        if self.chooser.showOpenDialog(None) == JFileChooser.APPROVE_OPTION:
+            selectedFiles = self.chooser.getSelectedFiles()
+
+            last = selectedFiles[-1]
+            self.chooser.setCurrentDirectory(last if last.isDirectory() else last.getParentFile())
 
-        for name, module_ in inspect.getmembers(module, lambda x: hasattr(x, 'descriptor_pb2')):
-            self.updateDescriptors(name, module_)
+            patterns = self.tab.extender.scanPatterns
+            self.tab.extender.loadProtos([selectedFile.getAbsolutePath() for selectedFile in selectedFiles], "Loading",
+                                         split_globs(patterns.include.getText()),
+                                         split_globs(patterns.exclude.getText()))
 
         return
 
-    # Method created to handle the situation in which a proto depends on another proto. In this situation the dependencies are imported recursively.
-    def importProtoFileRecusive(self, proto):
 
+class LoadProtoTask(Callable):
+    def __init__(self, extender, proto, graph):
+        self.extender = extender
+        self.proto = proto
+        self.graph = graph
+
+    def call(self):
+        start = time.time()
+        files, error = self.extender.importProtoFile(self.proto, self.graph)
+        return files, error, time.time() - start
+
+
+class LoadProtosTask(Runnable):
+    def __init__(self, extender, protos, progress):
+        self.extender = extender
+        self.protos = protos
+        self.progress = progress
+
+    def run(self):
         try:
-            module = compile_and_import_proto(proto)
-            if module:
-                return module
-            
+            loaded = list(self.extender.importProtoFiles(self.protos, self.progress))
+
+            # a cancelled load publishes nothing
+            if self.progress.cancelled:
+                self.progress.finish("Loading cancelled")
+                return
+
+            prepared = self.extender.prepareLoadedProtos(loaded)
         except (Exception, RuntimeException) as error:
-            
-            missing_module_regex = re.search('No module named (.*)_pb2', str(error))
-            compilation_regex = re.search('.*Module or method too large in `(.*)`.*', str(error)) #
-            
-            if(missing_module_regex):                
-                missing_module = missing_module_regex.group(1) + ".proto"                
-                self.tab.callbacks.getStdout().write('*** %s depends on %s. Trying to import it...!\n' % (proto, missing_module, ))
-                if self.importProtoFileRecusive(File(proto.getParent(),missing_module)):
-                    return self.importProtoFileRecusive(proto)
-                else:
-                    self.tab.callbacks.getStderr().write('*** ERROR, infinite recursion with proto %s!\n' % (str(proto.getAbsolutePath()), ))
-            
-            # This compile with python pb2 too large
-            elif(compilation_regex):
-                subprocess.check_call([PYTHON2_BINARY, '-m', 'py_compile', compilation_regex.group(1)])
-                return self.importProtoFileRecusive(proto)
-            
-            else:
-                self.tab.callbacks.getStderr().write('*** ERROR in recursive import: %s!\n' % (str(error), ))
-                tb = traceback.format_exc()
-                self.tab.callbacks.getStderr().write('Traceback: %s!\n' % (str(tb), ))
-                return None
+            self.progress.fail(traceback.format_exc())
+            self.progress.finish("Loading failed: %s" % (error, ))
+            return
 
-    def importProtoFiles(self, selectedFiles):
-        for selectedFile in selectedFiles:
-            if selectedFile.isDirectory():
-                self.chooser.setCurrentDirectory(selectedFile)
-                self.importProtoFiles(selectedFile.listFiles(ListProtoFileFilter()))
-            else:
-                self.chooser.setCurrentDirectory(selectedFile.getParentFile())
-                yield self.importProtoFileRecusive(selectedFile)
+        SwingUtilities.invokeLater(lambda: self.extender.addLoadedProtos(loaded, prepared))
+        self.progress.finish("%s: %d of %d loaded" % (
+            self.progress.title, len([files for _, files in loaded if files is not None]), len(self.protos)))
+        return
 
 
-    def actionPerformed(self, event):
-        if self.chooser.showOpenDialog(None) == JFileChooser.APPROVE_OPTION:
-            for module in self.importProtoFiles(self.chooser.getSelectedFiles()):
-                self.updateDescriptors(module.__name__, module)
+class WatchProtosTask(Runnable):
+    def __init__(self, extender):
+        self.extender = extender
+
+    def run(self):
+        # an exception would cancel the next checks
+        try:
+            changed = self.extender.watcher.changed()
+            if not changed:
+                return
+
+            self.extender.callbacks.getStdout().write('Reloading changed protos: %s\n' % (', '.join(changed), ))
+            loaded = list(self.extender.importProtoFiles([File(path) for path in changed]))
+            prepared = self.extender.prepareLoadedProtos(loaded)
+
+            SwingUtilities.invokeLater(lambda: self.extender.addLoadedProtos(loaded, prepared))
+
+        except (Exception, RuntimeException) as error:
+            self.extender.callbacks.getStderr().write('*** ERROR watching protos: %s\n%s' % (
+                error, traceback.format_exc()))
 
         return
 
 
+class RestoreProtosTask(LoadProtosTask):
+    def __init__(self, extender, paths, progress):
+        LoadProtosTask.__init__(self, extender, [], progress)
+        self.paths = paths
+
+    def run(self):
+        missing = []
+        for path in self.paths:
+            if os.path.isfile(path):
+                self.protos.append(File(path))
+            else:
+                self.extender.callbacks.getStderr().write('*** Cannot restore %s: file not found\n' % (path, ))
+                missing.append(path)
+
+        if missing:
+            SwingUtilities.invokeLater(lambda: self.extender.forgetProtos(missing))
+
+        return LoadProtosTask.run(self)
+
+
+# The selected files, with the protos found in the selected directories and their subdirectories
+class ScanProtosTask(LoadProtosTask):
+    def __init__(self, extender, paths, include, exclude, progress):
+        LoadProtosTask.__init__(self, extender, [], progress)
+        self.paths = paths
+        self.include = include
+        self.exclude = exclude
+
+    def run(self):
+        found = []
+        for path in self.paths:
+            if not os.path.isdir(path):
+                found.append(path)
+                continue
+
+            self.progress.scan(path)
+            for proto in walk_protos(path, self.include, self.exclude):
+                if self.progress.cancelled:
+                    self.progress.finish("Loading cancelled")
+                    return
+                found.append(proto)
+
+        self.protos.extend(File(path) for path in unique_protos(found))
+        self.extender.callbacks.getStdout().write('Found %d protos, %d duplicates skipped\n' % (
+            len(self.protos), len(found) - len(self.protos)))
+
+        return LoadProtosTask.run(self)
+
+
 # The purpose is being able to search for protos, if we have tons of proto
 class SearchProtoActionListener(ActionListener):
     def __init__(self, tab, component):
@@ -675,155 +1361,254 @@ class SearchProtoActionListener(ActionListener):
         self.tab.filter_search = JOptionPane.showInputDialog(self.component, "Search: ", "Search", 1);
 
 
+class PickTypeActionListener(ActionListener):
+    def __init__(self, tab, component):
+        self.tab = tab
+        self.component = component
+
+    def actionPerformed(self, event):
+        dialog = TypePickerDialog(SwingUtilities.getWindowAncestor(self.component), self.tab.extender.typeSearch(),
+                                  lambda descriptor: DeserializeProtoActionListener(self.tab, descriptor).actionPerformed(event))
+        dialog.setVisible(True)
+
+        return
+
+
+class AddRouteActionListener(ActionListener):
+    def __init__(self, extender, host, method, path, direction, message_type):
+        self.extender = extender
+        self.route = (host, path, method, direction, message_type)
+
+    def actionPerformed(self, event):
+        self.extender.routes.addRoute(*self.route)
+
+        return
+
+
+class ExpandMessageActionListener(ActionListener):
+    def __init__(self, tab):
+        self.tab = tab
+
+    def actionPerformed(self, event):
+        content, message, info, parameter, encoding, framing = self.tab._current
+
+        if content is not None:
+            self.tab.showDecoded(content, info, parameter, self.tab._descriptor, expand=True)
+
+        return
+
+
+class WatchProtoActionListener(ActionListener):
+    def __init__(self, extender):
+        self.extender = extender
+
+    def actionPerformed(self, event):
+        self.extender.setWatching(event.getSource().isSelected())
+
+
 class DeserializeProtoActionListener(ActionListener):
     def __init__(self, tab, descriptor):
         self.tab = tab
         self.descriptor = descriptor
 
     def actionPerformed(self, event):
-        content, message, info, parameter = self.tab._current
+        content, message, info, parameter, encoding, framing = self.tab._current
 
-        try:
+        if content is None:
+            return
 
-            # check if body is compressed (gzip)
-            # gunzip the content first if required
+        if self.descriptor != "raw":
 
-            if isGzip(info):
-                body = array.array('B', gUnzip(content[info.getBodyOffset():].tostring()))
-            else:
-                body = content[info.getBodyOffset():]
+            print "Parsing message with proto descriptor %s (by user)." % (self.descriptor.name)
 
-            if parameter is not None:
-                param = self.tab.helpers.getRequestParameter(
-                        content, parameter.getName())
+            # Deprecated method
+            #message = parse_message(self.descriptor, body)
 
-                if param is not None:
-                    rules = self.tab.extender.table.getParameterRules().get(parameter.getName(), {})
-                    body = param.getValue().encode('utf-8')
+        else:
 
-                    for rule in rules.get('before', []):
-                        body = rule(body)
+            print "Parsing message without any proto"
 
-            if parameter is None:
+        # decoded in background, errors are reported with a dialog
+        self.tab.showDecoded(content, info, parameter, self.descriptor, byUser=True)
 
-                # cut 5 bytes for grpc web
-                rawBytes = body
-                global oldPadding
-                global hasPadding 
-                hasPadding = False
+        return
 
-                oldPadding= rawBytes[0:4]
-                if rawBytes[0] == 0 and rawBytes[1] == 0 and rawBytes[2] == 0 and rawBytes[3] == 0:
-                    rawBytes = rawBytes[5:]
-                    hasPadding = True
 
-                body = rawBytes.tostring()               
-                #body = rawBytes
+# Loads a proto, a generated _pb2.py or a descriptor set. Returns the message types it defines
+# (with the ones it depends on) by module name qualified by package (see file_key), None if it cannot be compiled. Called from loading workers.
+def load_proto(proto, cache=None, graph=None):
+    from descriptor_set import read_descriptor_set
 
-            if self.descriptor != "raw":
+    extension = os.path.splitext(proto.getName())[-1]
 
-                print "Parsing message with proto descriptor %s (by user)." % (self.descriptor.name)
+    if extension in DESCRIPTOR_SET_EXTENSIONS:
+        with open(proto.getAbsolutePath(), 'rb') as f:
+            return descriptor_set_files(read_descriptor_set(f.read()))
 
-                # Deprecated method
-                #message = parse_message(self.descriptor, body)
-                
-                factory = message_factory.MessageFactory()
-                klass = factory.GetPrototype(self.descriptor)
-                klass_instance = klass()
-                klass_instance.ParseFromString(body)
+    if extension != '.proto':
+        # already generated, only compiled in order to avoid error with big proto files
+        return module_files(import_proto_module(proto.getParent(), proto.getName().replace('.py', ''), True))
 
-                message = klass_instance
+    if graph is None:
+        graph = ProtoGraph(proto.getAbsolutePath())
+    graph.check()
 
-                self.tab.editor.setText(str(klass_instance))
-                self.tab.editor.setEditable(True)
-                self.tab._current = (content, message, info, parameter)
-                self.tab.last_proto = self.descriptor
+    if LOAD_PROTOS_AS_MODULES:
+        module = module_name(graph.main.name)
+        return module_files(compile_cached(graph, cache, 'modules', compile_proto_graph,
+                                           lambda directory: import_proto_module(directory, module)))
 
-            else:
+    return descriptor_set_files(compile_cached(graph, cache, 'descriptors', compile_descriptor_set,
+                                               read_descriptor_set_file))
 
-                print "Parsing message without any proto"
 
-                process = subprocess.Popen([PROTOC_BINARY_LOCATION, '--decode_raw'],
-                                           stdin=subprocess.PIPE,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE)
+def descriptor_set_files(files):
+    from message_types import types_package
 
+    if files is None:
+        return None
+    return OrderedDict((file_key(name, types_package(types)), types) for name, types in files.iteritems())
 
-                output = error = None
-                try:
-                    output, error = process.communicate(body)
-                except OSError:
-                    pass
-                finally:
-                    if process.poll() != 0:
-                        process.wait()
 
-                if error:
-                    #print "protoc displaying message - error..."
-                    self.tab.editor.setText(error)                    
-                else:
-                    #print "protoc displaying message - output..."
-                    self.tab.editor.setText(output)                    
+# The message types of a generated module and of the generated modules it imports
+def module_files(module, files=None):
+    if module is None:
+        return None
 
-                self.tab.editor.setEditable(False)
-                self.tab._current = (content, None, info, parameter)
+    if files is None:
+        files = OrderedDict()
 
-        except Exception as error:
+    from message_types import descriptor_types
 
-            if self.descriptor != "raw":
-                title = "Error parsing message as %s!" % (self.descriptor.name, )
-            else:
-                title = "Error parsing message as without any proto"
-            JOptionPane.showMessageDialog(self.tab.getUiComponent(),
-                error.message + str(traceback.format_exc()), title, JOptionPane.ERROR_MESSAGE)
+    name = file_key(module.DESCRIPTOR.name, module.DESCRIPTOR.package)
+    if name in files:
+        return files
+    files[name] = descriptor_types(module.DESCRIPTOR)
 
-            #print(str(error))
-            #print(str(error.message))
-            #print(str(traceback.format_exc()))
+    for _, module_ in inspect.getmembers(module, lambda x: hasattr(x, 'descriptor_pb2')):
+        module_files(module_, files)
 
-        return
+    return files
 
 
-def compile_and_import_proto(proto):
-    curdir = os.path.abspath(os.curdir)
-    tempdir = tempfile.mkdtemp()
+# Runs compile(graph, directory) unless the graph was compiled in an earlier session, then load(directory)
+def compile_cached(graph, cache, kind, compile, load):
+    key = cache.key(graph, kind) if cache is not None else None
+    directory = cache.get(key) if key is not None else None
 
-    is_proto = os.path.splitext(proto.getName())[-1] == '.proto'
+    if directory is not None:
+        return load(directory)
 
-    if is_proto:
-        try:
-            os.chdir(os.path.abspath(proto.getParent()))
-            subprocess.check_call([PROTOC_BINARY_LOCATION, '--python_out',
-                                  tempdir, proto.getName()])
-            module = proto.getName().replace('.proto', '_pb2')
-
-        except subprocess.CalledProcessError as e:
-            print("*** ERROR COMPILING")
-            print(e)
-            shutil.rmtree(tempdir)
+    tempdir = tempfile.mkdtemp()
+
+    try:
+        if not compile(graph, tempdir):
             return None
 
-        finally:
-            os.chdir(curdir)
+        if key is not None:
+            try:
+                directory = cache.put(key, tempdir)
+            except EnvironmentError as e:
+                print("*** ERROR CACHING %s: %s" % (graph.main.name, e))
+
+        return load(directory or tempdir)
+
+    finally:
+        shutil.rmtree(tempdir)
 
-    else:
-        module = proto.getName().replace('.py', '')
 
+def protoc_command(graph, *options):
+    command = [PROTOC.path()]
+    command.extend(options)
+    for root in graph.roots:
+        command.extend(['-I', root])
+    command.extend(proto.name for proto in graph.order)
+    return command
+
+
+# Compiles every proto of the graph in a single descriptor set, nothing is generated
+def compile_descriptor_set(graph, directory):
     try:
-        if is_proto:
-            os.chdir(tempdir)
-        else:
-            os.chdir(proto.getParent())
+        subprocess.check_call(protoc_command(graph, '--include_imports', '--descriptor_set_out',
+                                             os.path.join(directory, DESCRIPTOR_SET_FILENAME)))
 
-        sys.path.append(os.path.abspath(os.curdir))
+    except subprocess.CalledProcessError as e:
+        print("*** ERROR COMPILING")
+        print(e)
+        return False
+
+    return True
+
+
+def read_descriptor_set_file(directory):
+    from descriptor_set import read_descriptor_set
+
+    with open(os.path.join(directory, DESCRIPTOR_SET_FILENAME), 'rb') as f:
+        return read_descriptor_set(f.read())
+
+
+# Compiles every proto of the graph with a single protoc run, then every generated module with a single python2 run
+def compile_proto_graph(graph, directory):
+    try:
+        subprocess.check_call(protoc_command(graph, '--python_out', directory))
+
+        # protos in subdirectories of their root are imported as packages
+        for path, _, names in os.walk(directory):
+            if path != directory and '__init__.py' not in names:
+                open(os.path.join(path, '__init__.py'), 'w').close()
 
         # Added compilation in order to avoid error with big proto files
-        subprocess.check_call([PYTHON2_BINARY, '-m', 'py_compile', str(module) + ".py"])
+        subprocess.check_call([PYTHON2_BINARY, '-m', 'compileall', '-q', directory])
+
+    except subprocess.CalledProcessError as e:
+        print("*** ERROR COMPILING")
+        print(e)
+        return False
+
+    return True
+
+
+# Loading workers share the current directory and sys.path
+IMPORT_LOCK = threading.Lock()
+
+def import_proto_module(directory, module, compile=False):
+    with IMPORT_LOCK:
+        return _import_proto_module(directory, module, compile)
+
+
+# Modules of the .py files in directory and its subdirectories
+def generated_modules(directory):
+    for path, _, names in os.walk(directory):
+        package = os.path.relpath(path, directory)
+
+        for name in names:
+            if name.endswith('.py'):
+                module = name[:-len('.py')]
+
+                if package != os.curdir:
+                    prefix = package.replace(os.sep, '.')
+                    module = prefix if module == '__init__' else '%s.%s' % (prefix, module)
+
+                yield module
+
+
+def _import_proto_module(directory, module, compile):
+    curdir = os.path.abspath(os.curdir)
+
+    # modules imported from an earlier version of the protos would be returned as they are
+    for name in ([module] if compile else generated_modules(directory)):
+        sys.modules.pop(name, None)
+
+    try:
+        os.chdir(directory)
+        sys.path.append(os.path.abspath(os.curdir))
+
+        if compile:
+            subprocess.check_call([PYTHON2_BINARY, '-m', 'py_compile', str(module) + ".py"])
 
         return importlib.import_module(module)
 
     except subprocess.CalledProcessError as e:
-    #except Exception as e:
         print("*** ERROR COMPILING")
         print(e)
         print(str(traceback.format_exc()))
@@ -831,5 +1616,7 @@ def compile_and_import_proto(proto):
     finally:
         sys.path.pop()
         os.chdir(curdir)
-        shutil.rmtree(tempdir)
 
+
+# Everything above is imported when Burp loads the extension
+LOADED_TIME = time.time()